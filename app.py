@@ -1,24 +1,43 @@
-from flask import Flask, request, jsonify, send_file, render_template_string
+from flask import Flask, Response, request, jsonify, send_file, render_template_string
 from flask_cors import CORS
 import os
 import numpy as np
-from scipy.fftpack import dct, idct
+from scipy import fft as sp_fft
 import pywt
 from pydub import AudioSegment
+from pydub.utils import mediainfo_json
 import zlib
 import tempfile
 import uuid
 import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+import functools
+import hashlib
+import glob
+import re
+from collections import OrderedDict
+import heapq
+from dataclasses import dataclass, asdict
 import time
 from werkzeug.utils import secure_filename
 from mutagen.flac import FLAC
 from mutagen.aiff import AIFF
 import base64
+import json
+import sqlite3
 import io
+import subprocess
+import struct
+import shutil
+import zipfile
+import soundfile as sf
 
 
 app = Flask(__name__)
-CORS(app)
+# Les métadonnées des réponses binaires passent par des en-têtes, à exposer aux clients cross-origin
+CORS(app, expose_headers=['X-Task-Id', 'X-Final-Modulation', 'X-Iterations', 'X-Batch-Id'])
 
 # Configuration
 class Config:
@@ -27,14 +46,113 @@ class Config:
 
 app.config.from_object(Config)
 
-# Dictionnaire pour stocker les tâches en cours
-active_tasks = {}
+# État des tâches : base SQLite partagée par tous les processus de l'hôte (workers web et pool)
+TASK_DB_PATH = os.environ.get('TASK_DB_PATH', os.path.join(Config.UPLOAD_FOLDER, 'watermark_tasks.sqlite3'))
+TASK_TTL = int(os.environ.get('TASK_TTL', 3600))  # secondes sans mise à jour avant expiration d'une tâche
+TASK_MAX_ENTRIES = int(os.environ.get('TASK_MAX_ENTRIES', 10000))
 
 LOSSLESS_FORMATS = ["wav", "flac", "aiff"]
 LOSSY_FORMATS = ["mp3", "aac", "ogg", "wma", "m4a", "opus"]
 
 SUPPORTED_EXTENSIONS = ['wav', 'flac', 'aiff', 'mp3', 'ogg', 'aac', 'm4a', 'opus', 'wma']
 
+# Formats lossless encodés/décodés en mémoire par soundfile, sans ffmpeg
+SOUNDFILE_FORMATS = {"wav": "WAV", "flac": "FLAC", "aiff": "AIFF"}
+# Résolutions PCM lues par soundfile et type de lecture : mêmes entiers que pydub (24 bits cadrés sur 32)
+SOUNDFILE_READ_DTYPES = {"PCM_16": "int16", "PCM_24": "int32", "PCM_32": "int32"}
+# Muxers ffmpeg capables d'écrire sur un pipe (sortie non seekable) ; les autres formats (m4a) repassent par pydub
+FFMPEG_PIPE_MUXERS = {"mp3": "mp3", "ogg": "ogg", "opus": "opus", "aac": "adts", "wma": "asf_stream"}
+LOSSY_BITRATE = "320k"
+# Mode streaming : nombre de segments décodés/marqués/encodés par bloc, et taille d'upload à partir de laquelle il s'active
+STREAM_BLOCK_SEGMENTS = int(os.environ.get('STREAM_BLOCK_SEGMENTS', 256))
+STREAMING_THRESHOLD_BYTES = int(os.environ.get('STREAMING_THRESHOLD_BYTES', 32 * 1024 * 1024))
+# Ingestion lossless : uploads WAV/FLAC/AIFF transmis en mémoire au job sous ce seuil, décodés par blocs
+INGEST_MEMORY_THRESHOLD = int(os.environ.get('INGEST_MEMORY_THRESHOLD', 16 * 1024 * 1024))
+INGEST_BLOCK_FRAMES = 65536
+
+# Nombre de threads utilisés par scipy.fft pour les transformées par lots (1 = mono-thread)
+TRANSFORM_WORKERS = int(os.environ.get('TRANSFORM_WORKERS', 1))
+# Nombre maximal de segments transformés en une seule fois (borne la mémoire des lots)
+TRANSFORM_BATCH_SEGMENTS = int(os.environ.get('TRANSFORM_BATCH_SEGMENTS', 4096))
+# Nombre de tables de clé (permutation + indices de coefficients) gardées en cache LRU
+KEY_SCHEDULE_CACHE_SIZE = int(os.environ.get('KEY_SCHEDULE_CACHE_SIZE', 64))
+# Vecteurs de base (lignes de DCT, chaîne DWT-DCT) gardés par processus, en octets ; au-delà, retour aux transformées
+BASIS_CACHE_BYTES = int(os.environ.get('BASIS_CACHE_BYTES', 128 * 1024 * 1024))
+
+# Recherche de la force de modulation dans embed_watermark_with_test
+SEARCH_MODES = ["bisect", "linear"]
+# Calcul de l'insertion : transformées par segment, ou ajout direct des vecteurs de base en cache
+EMBED_MODES = ["transform", "basis"]
+# Décision à l'extraction : votes ±1 et majorité (historique), ou LLR sommés et Hamming à entrée souple
+DECISIONS = ["hard", "soft"]
+# Nombre de segments dont les motifs temporels sont sommés en une fois en mode "basis"
+BASIS_BATCH_SEGMENTS = 64
+MODULATION_STEP = 0.005
+
+# Fichiers temporaires (uploads, résultats) : un répertoire de spool commun, avec quota
+TEMP_SPOOL_DIR = os.environ.get('TEMP_SPOOL_DIR', os.path.join(Config.UPLOAD_FOLDER, 'watermark_spool'))
+TEMP_QUOTA_BYTES = int(os.environ.get('TEMP_QUOTA_BYTES', 2 * 1024 * 1024 * 1024))
+TEMP_ORPHAN_AGE = int(os.environ.get('TEMP_ORPHAN_AGE', 6 * 3600))  # âge au-delà duquel un fichier est orphelin
+TEMP_SWEEP_INTERVAL = int(os.environ.get('TEMP_SWEEP_INTERVAL', 600))  # secondes entre deux balayages du spool
+
+# Cache du PCM décodé, indexé par empreinte du contenu : niveau mémoire par processus, niveau disque partagé.
+# PCM_CACHE_MEMORY_BYTES est un budget par hôte, réparti entre les processus de jobs de tous les workers web
+PCM_CACHE_DIR = os.environ.get('PCM_CACHE_DIR', os.path.join(Config.UPLOAD_FOLDER, 'watermark_pcm_cache'))
+PCM_CACHE_MEMORY_BYTES = int(os.environ.get('PCM_CACHE_MEMORY_BYTES', 256 * 1024 * 1024))
+PCM_CACHE_DISK_BYTES = int(os.environ.get('PCM_CACHE_DISK_BYTES', 4 * 1024 * 1024 * 1024))
+# Durée de vie du marqueur d'un contenu décodé une seule fois (écrit sur disque à son deuxième décodage)
+PCM_CACHE_SEEN_TTL = int(os.environ.get('PCM_CACHE_SEEN_TTL', 24 * 3600))
+
+# Synchronisation à l'extraction : décalage maximal accepté pour sync_max_offset (échantillons).
+# Coût linéaire en décalage et en durée : ~3 s pour 16384 sur un extrait de 60 s
+SYNC_MAX_OFFSET_LIMIT = int(os.environ.get('SYNC_MAX_OFFSET_LIMIT', 16384))
+
+# Détection multi-candidats (/api/detect) : nombre maximal de jeux de paramètres par requête
+DETECT_MAX_CANDIDATES = int(os.environ.get('DETECT_MAX_CANDIDATES', 256))
+
+def available_cpus():
+    """Processeurs utilisables par ce processus : affinité, bornée par un quota CPU cgroup (v2 puis v1)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    for quota_path, period_path in (
+        ('/sys/fs/cgroup/cpu.max', None),
+        ('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', '/sys/fs/cgroup/cpu/cpu.cfs_period_us'),
+    ):
+        try:
+            with open(quota_path) as f:
+                fields = f.read().split()
+            if period_path is not None:
+                with open(period_path) as f:
+                    fields.append(f.read().strip())
+            if fields[0] not in ('max', '-1'):
+                cpus = min(cpus, max(1, -(-int(fields[0]) // int(fields[1]))))
+            break
+        except (OSError, ValueError, IndexError):
+            continue
+    return cpus
+
+# Tâches asynchrones : pool de processus borné, résultats déposés dans le répertoire de spool.
+# Chaque worker web (gunicorn, WEB_CONCURRENCY) a son propre pool : par défaut, les processeurs
+# disponibles sont répartis entre eux plutôt que multipliés
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', max(1, available_cpus() // WEB_CONCURRENCY)))
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 600))  # secondes de conservation d'un résultat
+
+# Traitement par lots (/api/batch/embed, /api/batch/extract) : fichiers par requête, jobs du lot
+# soumis simultanément au pool, taille décompressée maximale d'une archive zip
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 1000))
+BATCH_IN_FLIGHT = int(os.environ.get('BATCH_IN_FLIGHT', 2 * JOB_WORKERS))
+BATCH_MAX_ARCHIVE_BYTES = int(os.environ.get('BATCH_MAX_ARCHIVE_BYTES', TEMP_QUOTA_BYTES // 2))
+
+# Réponses d'insertion : fichier binaire par défaut, JSON base64 historique sur demande
+RESPONSE_FORMATS = ["binary", "base64"]
+AUDIO_MIMETYPES = {
+    "wav": "audio/wav", "flac": "audio/flac", "aiff": "audio/aiff", "mp3": "audio/mpeg", "ogg": "audio/ogg",
+    "opus": "audio/ogg", "aac": "audio/aac", "m4a": "audio/mp4", "wma": "audio/x-ms-wma"
+}
+
 # Page HTML pour l'interface utilisateur
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -224,6 +342,30 @@ HTML_TEMPLATE = """
                         <input type="number" id="n-coeffs" name="n_coeffs" value="5" min="1" max="20">
                     </div>
                     
+                    <div class="form-group">
+                        <label for="search-mode">Recherche de la force de modulation:</label>
+                        <select id="search-mode" name="search_mode">
+                            <option value="bisect">Rapide (rampe + dichotomie)</option>
+                            <option value="linear">Linéaire (pas de 0.005)</option>
+                        </select>
+                    </div>
+                    
+                    <div class="form-group">
+                        <label for="embed-mode">Calcul de l'insertion:</label>
+                        <select id="embed-mode" name="embed_mode">
+                            <option value="transform">Transformées (DCT + IDCT)</option>
+                            <option value="basis">Vecteurs de base (sans transformée)</option>
+                        </select>
+                    </div>
+                    
+                    <div class="form-group">
+                        <label for="decision">Décision à la vérification:</label>
+                        <select id="decision" name="decision">
+                            <option value="hard">Dure (votes et majorité)</option>
+                            <option value="soft">Souple (corrélations cumulées)</option>
+                        </select>
+                    </div>
+                    
                     <div class="dwt-options" style="display: none;">
                         <div class="form-group">
                             <label for="dwt-level">Niveau DWT:</label>
@@ -319,6 +461,14 @@ HTML_TEMPLATE = """
                         <input type="number" id="n-coeffs-extract" name="n_coeffs" value="5" min="1" max="20">
                     </div>
                     
+                    <div class="form-group">
+                        <label for="decision-extract">Décision:</label>
+                        <select id="decision-extract" name="decision">
+                            <option value="hard">Dure (votes et majorité)</option>
+                            <option value="soft">Souple (corrélations cumulées)</option>
+                        </select>
+                    </div>
+                    
                     <div class="dwt-options-extract" style="display: none;">
                         <div class="form-group">
                             <label for="dwt-level-extract">Niveau DWT:</label>
@@ -448,7 +598,7 @@ HTML_TEMPLATE = """
         });
         
         // Fonction pour suivre la progression d'une tâche
-        function trackTaskProgress(taskId, progressBar, resultDiv, callback) {
+        function trackTaskProgress(taskId, progressBar, resultDiv, resultTextId, callback) {
             const interval = setInterval(() => {
                 fetch(`/api/task/${taskId}`)
                     .then(response => response.json())
@@ -464,7 +614,7 @@ HTML_TEMPLATE = """
                             progressBar.style.backgroundColor = '#f44336';
                             progressBar.textContent = 'Erreur';
                             resultDiv.style.display = 'block';
-                            document.getElementById('result-text-embed').textContent = data.error || 'Une erreur est survenue';
+                            document.getElementById(resultTextId).textContent = data.error || 'Une erreur est survenue';
                         } else {
                             const progress = data.progress || 0;
                             progressBar.style.width = `${progress}%`;
@@ -477,6 +627,39 @@ HTML_TEMPLATE = """
             }, 1000);
         }
         
+        // Récupération du résultat d'une tâche terminée
+        function fetchTaskResult(taskId, resultDiv, resultTextId, callback) {
+            fetch(`/api/result/${taskId}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (data.error) {
+                        throw new Error(data.error);
+                    }
+                    callback(data);
+                })
+                .catch(error => {
+                    resultDiv.style.display = 'block';
+                    document.getElementById(resultTextId).textContent = error.message || 'Une erreur est survenue';
+                });
+        }
+        
+        // Récupération du fichier produit par une insertion (réponse binaire, métadonnées en en-têtes)
+        function fetchEmbedResult(taskId, resultDiv, callback) {
+            fetch(`/api/result/${taskId}`)
+                .then(response => {
+                    if (!response.ok) {
+                        return response.json().then(data => {
+                            throw new Error(data.error || 'Une erreur est survenue');
+                        });
+                    }
+                    return response.blob().then(blob => callback(blob, response.headers));
+                })
+                .catch(error => {
+                    resultDiv.style.display = 'block';
+                    document.getElementById('result-text-embed').textContent = error.message || 'Une erreur est survenue';
+                });
+        }
+        
         // Formulaire d'insertion de watermark
         document.getElementById('embed-form').addEventListener('submit', function(e) {
             e.preventDefault();
@@ -503,28 +686,32 @@ HTML_TEMPLATE = """
                     throw new Error(data.error);
                 }
                 
-                // Suivre la progression
-                trackTaskProgress(data.task_id, progressBar, resultDiv, function(taskData) {
-                    resultDiv.style.display = 'block';
-                    document.getElementById('result-text-embed').textContent = `Watermark inséré avec succès. Force de modulation finale: ${data.final_modulation}`;
+                // Suivre la progression, puis récupérer le résultat
+                trackTaskProgress(data.task_id, progressBar, resultDiv, 'result-text-embed', function(taskData) {
+                    fetchEmbedResult(data.task_id, resultDiv, function(blob, headers) {
+                        resultDiv.style.display = 'block';
+                        document.getElementById('result-text-embed').textContent = `Watermark inséré avec succès. Force de modulation finale: ${headers.get('X-Final-Modulation')} (${headers.get('X-Iterations')} tentative(s))`;
                     
-                    // Créer un lien de téléchargement
-                    const downloadContainer = document.getElementById('download-container');
-                    downloadContainer.innerHTML = '';
-                    const downloadLink = document.createElement('a');
-                    downloadLink.href = `data:audio/${data.filename.split('.').pop()};base64,${data.file_data}`;
-                    downloadLink.download = data.filename;
-                    downloadLink.textContent = 'Télécharger le fichier audio avec watermark';
-                    downloadLink.style.display = 'block';
-                    downloadLink.style.marginTop = '10px';
-                    downloadLink.classList.add('button');
-                    downloadLink.style.textDecoration = 'none';
-                    downloadLink.style.backgroundColor = '#4CAF50';
-                    downloadLink.style.color = 'white';
-                    downloadLink.style.padding = '10px 15px';
-                    downloadLink.style.borderRadius = '4px';
-                    downloadLink.style.textAlign = 'center';
-                    downloadContainer.appendChild(downloadLink);
+                        // Créer un lien de téléchargement vers le fichier reçu
+                        const sourceName = document.getElementById('audio-file-embed').files[0].name;
+                        const dot = sourceName.lastIndexOf('.');
+                        const downloadContainer = document.getElementById('download-container');
+                        downloadContainer.innerHTML = '';
+                        const downloadLink = document.createElement('a');
+                        downloadLink.href = URL.createObjectURL(blob);
+                        downloadLink.download = dot > 0 ? `${sourceName.slice(0, dot)}_watermarked${sourceName.slice(dot)}` : `${sourceName}_watermarked`;
+                        downloadLink.textContent = 'Télécharger le fichier audio avec watermark';
+                        downloadLink.style.display = 'block';
+                        downloadLink.style.marginTop = '10px';
+                        downloadLink.classList.add('button');
+                        downloadLink.style.textDecoration = 'none';
+                        downloadLink.style.backgroundColor = '#4CAF50';
+                        downloadLink.style.color = 'white';
+                        downloadLink.style.padding = '10px 15px';
+                        downloadLink.style.borderRadius = '4px';
+                        downloadLink.style.textAlign = 'center';
+                        downloadContainer.appendChild(downloadLink);
+                    });
                 });
             })
             .catch(error => {
@@ -563,9 +750,11 @@ HTML_TEMPLATE = """
                 }
                 
                 // Suivre la progression
-                trackTaskProgress(data.task_id, progressBar, resultDiv, function(taskData) {
-                    resultDiv.style.display = 'block';
-                    document.getElementById('result-text-extract').textContent = data.extracted_watermark || 'Aucun watermark détecté';
+                trackTaskProgress(data.task_id, progressBar, resultDiv, 'result-text-extract', function(taskData) {
+                    fetchTaskResult(data.task_id, resultDiv, 'result-text-extract', function(data) {
+                        resultDiv.style.display = 'block';
+                        document.getElementById('result-text-extract').textContent = data.extracted_watermark || 'Aucun watermark détecté';
+                    });
                 });
             })
             .catch(error => {
@@ -588,31 +777,665 @@ def get_audio_format(filepath):
 def is_lossless(fmt):
     return fmt in LOSSLESS_FORMATS
 
-def cleanup_file(filepath, delay=60):  # Réduit le délai à 1 minute
-    """Nettoie un fichier après un délai plus court pour Render"""
-    def delayed_cleanup():
-        time.sleep(delay)
+def read_audio_header(audio_source, size=12):
+    """Premiers octets d'un chemin ou d'un fichier ouvert (dont la position est rétablie)."""
+    if isinstance(audio_source, (str, os.PathLike)):
+        with open(audio_source, 'rb') as f:
+            return f.read(size)
+    position = audio_source.tell()
+    header = audio_source.read(size)
+    audio_source.seek(position)
+    return header
+
+def sniff_audio_format(header):
+    """Format lossless reconnu à sa signature (RIFF/RF64 WAVE, fLaC, FORM AIFF/AIFC), sinon None."""
+    if header[:4] in (b'RIFF', b'RF64') and header[8:12] == b'WAVE':
+        return "wav"
+    if header[:4] == b'fLaC':
+        return "flac"
+    if header[:4] == b'FORM' and header[8:12] in (b'AIFF', b'AIFC'):
+        return "aiff"
+    return None
+
+class TempFileManager:
+    """Fichiers temporaires du service, tous créés dans un même répertoire de spool.
+
+    Un unique thread supprime les fichiers arrivés à échéance (tas trié sur l'heure de suppression).
+    Quand le répertoire dépasse quota_bytes, les fichiers programmés les plus proches de leur échéance
+    sont supprimés par anticipation. L'occupation est tenue à jour à chaque programmation et
+    suppression ; les octets des autres fichiers (autres processus, fichiers non programmés) sont
+    recomptés tous les sweep_interval secondes par le même thread, qui balaie alors aussi les fichiers
+    plus vieux que orphan_age (au démarrage : ceux d'une exécution précédente).
+    """
+    def __init__(self, directory, quota_bytes=TEMP_QUOTA_BYTES, orphan_age=TEMP_ORPHAN_AGE, sweep_interval=TEMP_SWEEP_INTERVAL):
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self.orphan_age = orphan_age
+        self.sweep_interval = sweep_interval
+        self._heap = []
+        self._deadlines = {}
+        # Taille de chaque fichier programmé, leur total, et les octets du spool hors de ce suivi
+        self._sizes = {}
+        self._scheduled_bytes = 0
+        self._untracked_bytes = 0
+        self._counted_at = time.time()
+        self._condition = threading.Condition()
+        self._reaper = None
+        os.makedirs(directory, exist_ok=True)
+        self.sweep_orphans()
+        self._untracked_bytes = self.held_bytes()
+
+    def new_path(self, suffix=""):
+        return os.path.join(self.directory, f"{uuid.uuid4().hex}{suffix}")
+
+    def schedule(self, path, delay=60):
+        """Programme la suppression de `path` dans `delay` secondes (remplace une échéance antérieure)."""
+        deadline = time.time() + delay
         try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-        except:
+            stat = os.stat(path)
+            size, modified = stat.st_size, stat.st_mtime
+        except OSError:
+            size, modified = 0, time.time()
+        with self._condition:
+            if path not in self._sizes and modified < self._counted_at:
+                # Déjà compté parmi les octets non suivis lors du dernier recomptage
+                self._untracked_bytes = max(0, self._untracked_bytes - size)
+            self._scheduled_bytes += size - self._sizes.get(path, 0)
+            self._sizes[path] = size
+            self._deadlines[path] = deadline
+            heapq.heappush(self._heap, (deadline, path))
+            # Démarrage paresseux : un thread lancé à l'import ne survivrait pas au fork des workers
+            if self._reaper is None or not self._reaper.is_alive():
+                self._reaper = threading.Thread(target=self._reap, daemon=True)
+                self._reaper.start()
+            self._condition.notify()
+            over_quota = self._scheduled_bytes + self._untracked_bytes > self.quota_bytes
+        if over_quota:
+            self.enforce_quota()
+
+    def _forget(self, path):
+        # Appelé sous self._condition, quand un fichier programmé est supprimé
+        del self._deadlines[path]
+        self._scheduled_bytes -= self._sizes.pop(path, 0)
+        self._remove(path)
+
+    def _reap(self):
+        next_sweep = time.time() + self.sweep_interval
+        while True:
+            with self._condition:
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now:
+                    deadline, path = heapq.heappop(self._heap)
+                    # Les entrées remplacées par un schedule() plus récent sont ignorées
+                    if self._deadlines.get(path) == deadline:
+                        self._forget(path)
+                if now < next_sweep:
+                    wake = min(self._heap[0][0], next_sweep) if self._heap else next_sweep
+                    self._condition.wait(wake - now)
+                    continue
+            # Balayage périodique, hors verrou : orphelins laissés en cours d'exécution, et recomptage
+            # des octets non suivis par ce processus
+            next_sweep = now + self.sweep_interval
+            self.sweep_orphans()
+            counted_at = time.time()
+            held = self.held_bytes()
+            with self._condition:
+                self._untracked_bytes = max(0, held - self._scheduled_bytes)
+                self._counted_at = counted_at
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
             pass
-    threading.Thread(target=delayed_cleanup, daemon=True).start()
+
+    def held_bytes(self):
+        """Octets occupés dans le répertoire de spool, tous processus confondus."""
+        total = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        total += entry.stat().st_size
+                except OSError:
+                    pass
+        return total
+
+    def enforce_quota(self):
+        with self._condition:
+            for deadline, path in sorted(self._heap):
+                if self._scheduled_bytes + self._untracked_bytes <= self.quota_bytes:
+                    break
+                if self._deadlines.get(path) == deadline:
+                    self._forget(path)
+            self._heap = [(deadline, path) for deadline, path in self._heap if self._deadlines.get(path) == deadline]
+            heapq.heapify(self._heap)
+
+    def sweep_orphans(self):
+        # Les fichiers programmés par ce processus suivent leur échéance
+        cutoff = time.time() - self.orphan_age
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.path not in self._deadlines and entry.stat().st_mtime < cutoff:
+                        self._remove(entry.path)
+                except OSError:
+                    pass
+
+class TaskStore:
+    """État des tâches partagé entre processus, dans une base SQLite en mode WAL.
+
+    Une ligne par tâche (clé primaire task_id) : statut, progression, et les autres champs en JSON.
+    Les tâches non mises à jour depuis `ttl` secondes expirent ; au-delà de `max_entries`,
+    les plus anciennes sont évincées. Chaque thread (et chaque processus) a sa propre connexion.
+    """
+    def __init__(self, path, ttl=TASK_TTL, max_entries=TASK_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS tasks (task_id TEXT PRIMARY KEY, status TEXT NOT NULL, "
+            "progress INTEGER NOT NULL, data TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._connect().execute("CREATE INDEX IF NOT EXISTS tasks_updated ON tasks (updated)")
+
+    def _connect(self):
+        # Connexion par thread, rouverte après un fork (gunicorn --preload)
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def create(self, task_id, status="queued", progress=0, **data):
+        now = time.time()
+        db = self._connect()
+        db.execute("INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?)", (task_id, status, progress, json.dumps(data), now))
+        self._evict(db, now)
+
+    def _evict(self, db, now):
+        db.execute("DELETE FROM tasks WHERE updated < ?", (now - self.ttl,))
+        excess = db.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] - self.max_entries
+        if excess > 0:
+            db.execute("DELETE FROM tasks WHERE task_id IN (SELECT task_id FROM tasks ORDER BY updated LIMIT ?)", (excess,))
+
+    def get(self, task_id):
+        row = self._connect().execute(
+            "SELECT status, progress, data FROM tasks WHERE task_id = ? AND updated >= ?",
+            (task_id, time.time() - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        task = json.loads(row[2])
+        task["status"] = row[0]
+        task["progress"] = row[1]
+        return task
+
+    def update(self, task_id, status=None, progress=None, **data):
+        """Met à jour une tâche existante (sans effet si elle a expiré ou n'existe pas)."""
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT status, progress, data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is not None:
+                merged = json.loads(row[2])
+                merged.update(data)
+                db.execute(
+                    "UPDATE tasks SET status = ?, progress = ?, data = ?, updated = ? WHERE task_id = ?",
+                    (status or row[0], row[1] if progress is None else progress, json.dumps(merged), time.time(), task_id)
+                )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def touch(self, task_ids):
+        """Repousse l'expiration de tâches existantes, sans modifier leur état (tâches d'un lot en cours)."""
+        task_ids = list(task_ids)
+        db = self._connect()
+        now = time.time()
+        # Par paquets, sous la limite de paramètres des anciennes versions de SQLite
+        for first in range(0, len(task_ids), 500):
+            chunk = task_ids[first:first + 500]
+            db.execute(f"UPDATE tasks SET updated = ? WHERE task_id IN ({', '.join('?' * len(chunk))})", (now, *chunk))
+
+    def set_progress(self, task_id, progress):
+        """Progression monotone d'une tâche encore en cours, appelée depuis les workers du pool."""
+        self._connect().execute(
+            "UPDATE tasks SET status = 'processing', progress = MAX(progress, ?), updated = ? "
+            "WHERE task_id = ? AND status IN ('queued', 'processing')",
+            (progress, time.time(), task_id)
+        )
+
+class DecodedAudioCache:
+    """PCM décodé des fichiers reçus, indexé par l'empreinte SHA-256 de leur contenu (audio_id).
+
+    Niveau mémoire : LRU propre au processus, limité à memory_bytes. Niveau disque : un fichier
+    .npy par audio_id (fréquence d'échantillonnage dans le nom), partagé par les processus de
+    l'hôte, limité à disk_bytes avec éviction des moins récemment lus. Le PCM 16 bits est stocké en
+    int16 quand il le restitue à l'identique ; les autres résolutions (24/32 bits, hors de [-1, 1))
+    restent en float32. Un contenu n'est écrit sur disque que s'il a été envoyé sur /api/upload ou
+    décodé pour la deuxième fois (marqueur .seen) : un fichier traité une seule fois reste en mémoire.
+    Les tableaux renvoyés sont en lecture seule.
+    """
+    def __init__(self, directory, memory_bytes=PCM_CACHE_MEMORY_BYTES, disk_bytes=PCM_CACHE_DISK_BYTES):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_held = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def content_hash(audio_source):
+        """Empreinte d'octets, d'un chemin ou d'un fichier ouvert (dont la position est rétablie)."""
+        digest = hashlib.sha256()
+        if isinstance(audio_source, bytes):
+            digest.update(audio_source)
+        elif isinstance(audio_source, str):
+            with open(audio_source, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        else:
+            position = audio_source.tell()
+            for chunk in iter(lambda: audio_source.read(1024 * 1024), b''):
+                digest.update(chunk)
+            audio_source.seek(position)
+        return digest.hexdigest()
+
+    @staticmethod
+    def is_valid_id(audio_id):
+        return re.fullmatch(r'[0-9a-f]{64}', audio_id or '') is not None
+
+    def _disk_path(self, audio_id):
+        matches = glob.glob(os.path.join(self.directory, f"{audio_id}.*.npy"))
+        return matches[0] if matches else None
+
+    def on_disk(self, audio_id):
+        return self._disk_path(audio_id) is not None
+
+    def contains(self, audio_id):
+        with self._lock:
+            if audio_id in self._memory:
+                return True
+        return self._disk_path(audio_id) is not None
+
+    def get(self, audio_id):
+        """Renvoie (échantillons float32, fréquence) ou None si l'audio n'est pas (plus) en cache."""
+        with self._lock:
+            if audio_id in self._memory:
+                self._memory.move_to_end(audio_id)
+                return self._memory[audio_id]
+        path = self._disk_path(audio_id)
+        if path is None:
+            return None
+        try:
+            pcm = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        sample_rate = int(os.path.basename(path).split('.')[1])
+        samples = pcm.astype(np.float32)
+        if pcm.dtype == np.int16:
+            samples /= 32768.0
+        self._remember(audio_id, samples, sample_rate)
+        return samples, sample_rate
+
+    def put(self, audio_id, samples, sample_rate, persist=None):
+        """Met en cache un PCM décodé (float32, sans copie) ; persist=True l'écrit aussi sur disque,
+        None seulement si le même contenu a déjà été décodé sur l'hôte."""
+        samples = np.asarray(samples, dtype=np.float32)
+        if persist is None:
+            persist = self._seen_before(audio_id)
+        path = os.path.join(self.directory, f"{audio_id}.{sample_rate}.npy")
+        if persist and not os.path.exists(path):
+            temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            self._write_pcm(temp_path, samples)
+            os.replace(temp_path, path)
+            self._evict_disk()
+        self._remember(audio_id, samples, sample_rate)
+        return samples, sample_rate
+
+    def _seen_before(self, audio_id):
+        # Premier décodage : dépose le marqueur ; deuxième : le retire, le .npy prend le relais
+        marker = os.path.join(self.directory, f"{audio_id}.seen")
+        try:
+            os.remove(marker)
+            return True
+        except FileNotFoundError:
+            pass
+        open(marker, 'a').close()
+        self._evict_disk()
+        return False
+
+    @staticmethod
+    def _write_pcm(path, samples):
+        """Écrit le .npy par blocs, sans copie du signal entier : int16 si chaque échantillon x 32768 est
+        un entier représentable (PCM 16 bits), float32 sinon."""
+        step = INGEST_BLOCK_FRAMES * 16
+        exact = True
+        for first in range(0, len(samples), step):
+            scaled = samples[first:first + step] * np.float32(32768.0)
+            if not np.array_equal(scaled.astype(np.int16), scaled):
+                exact = False
+                break
+        if not len(samples):
+            with open(path, 'wb') as f:
+                np.save(f, samples)
+            return
+        pcm = np.lib.format.open_memmap(path, mode='w+', dtype=np.int16 if exact else np.float32, shape=samples.shape)
+        for first in range(0, len(samples), step):
+            block = samples[first:first + step]
+            pcm[first:first + step] = block * np.float32(32768.0) if exact else block
+        pcm.flush()
+        del pcm
+
+    def _remember(self, audio_id, samples, sample_rate):
+        samples.setflags(write=False)
+        if samples.nbytes > self.memory_bytes:
+            return
+        with self._lock:
+            if audio_id in self._memory:
+                return
+            self._memory[audio_id] = (samples, sample_rate)
+            self._memory_held += samples.nbytes
+            while self._memory_held > self.memory_bytes:
+                _, (evicted, _) = self._memory.popitem(last=False)
+                self._memory_held -= evicted.nbytes
+
+    def _evict_disk(self):
+        entries = []
+        stale_marker = time.time() - PCM_CACHE_SEEN_TTL
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                try:
+                    if entry.name.endswith('.seen') and entry.stat().st_mtime < stale_marker:
+                        os.remove(entry.path)
+                    elif entry.name.endswith('.npy'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                except OSError:
+                    pass
+        held = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if held <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            held -= size
+
+class KeySchedule:
+    """Tables dérivées de la clé pour un découpage donné : segments porteurs et
+    indices des coefficients modulés, un bit par ligne (tableaux int32 en lecture seule)."""
+    def __init__(self, segment_indices, coeff_indices):
+        self.segment_indices = segment_indices
+        self.coeff_indices = coeff_indices
+        self.segment_indices.setflags(write=False)
+        self.coeff_indices.setflags(write=False)
+
+    def __len__(self):
+        return len(self.segment_indices)
+
+class FfmpegStreamEncoder:
+    """Encodeur ffmpeg alimenté bloc par bloc en PCM 16 bits mono sur stdin.
+
+    La sortie passe par pipe:1 redirigé vers output_path, ce qui donne les mêmes octets que
+    l'encodage en mémoire de codec_round_trip.
+    """
+    def __init__(self, output_path, fmt, sample_rate):
+        args = [AudioSegment.converter, '-hide_banner', '-loglevel', 'error',
+                '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', 'pipe:0']
+        codec = AudioSegment.DEFAULT_CODECS.get(fmt)
+        if codec:
+            args += ['-acodec', codec]
+        args += ['-b:a', LOSSY_BITRATE, '-f', FFMPEG_PIPE_MUXERS[fmt], 'pipe:1']
+        self._output = open(output_path, 'wb')
+        self._stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=self._output, stderr=self._stderr)
+
+    def write(self, pcm):
+        self.process.stdin.write(pcm.tobytes())
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            returncode = self.process.wait()
+            if returncode != 0:
+                self._stderr.seek(0)
+                raise RuntimeError(f"ffmpeg a échoué (code {returncode}) : {self._stderr.read().decode(errors='ignore')}")
+        finally:
+            self._output.close()
+            self._stderr.close()
+
+class EmbedResult:
+    """Résultat de embed_watermark_with_test : l'artefact encodé vérifié est renvoyé tel quel,
+    pour ne pas ré-encoder le fichier de sortie."""
+    def __init__(self, watermarked_audio, modulation, iterations, audio_bytes, check_audio=None, output_path=None):
+        self.watermarked_audio = watermarked_audio
+        self.modulation = modulation
+        self.iterations = iterations
+        self.audio_bytes = audio_bytes
+        self.check_audio = check_audio
+        # Mode streaming : le fichier encodé est sur disque plutôt qu'en mémoire
+        self.output_path = output_path
+
+@dataclass(frozen=True)
+class WatermarkParams:
+    """Paramètres d'insertion/extraction d'une requête. Immuables : deux requêtes concurrentes ne partagent rien."""
+    method: str = 'DCT'
+    segment_length: int = 2048
+    seed: int = 42
+    modulation_strength: float = 0.005
+    band_lower_pct: float = 33
+    band_upper_pct: float = 66
+    dwt_level: int = 1
+    dwt_wavelet: str = 'haar'
+    dwt_coeff_type: str = 'cA'
+    n_coeffs: int = 5
+    embed_mode: str = 'transform'
+    decision: str = 'hard'
+
+    @classmethod
+    def from_form(cls, form):
+        """Lit les paramètres optionnels d'un formulaire, les absents prenant les valeurs par défaut."""
+        defaults = cls()
+        return cls(
+            method=form.get('method', defaults.method),
+            segment_length=int(form.get('segment_length', defaults.segment_length)),
+            seed=int(form.get('seed', defaults.seed)),
+            modulation_strength=float(form.get('modulation_strength', defaults.modulation_strength)),
+            band_lower_pct=float(form.get('band_lower_pct', defaults.band_lower_pct)),
+            band_upper_pct=float(form.get('band_upper_pct', defaults.band_upper_pct)),
+            dwt_level=int(form.get('dwt_level', defaults.dwt_level)),
+            dwt_wavelet=form.get('dwt_wavelet', defaults.dwt_wavelet),
+            dwt_coeff_type=form.get('dwt_coeff_type', defaults.dwt_coeff_type),
+            n_coeffs=int(form.get('n_coeffs', defaults.n_coeffs)),
+            embed_mode=form.get('embed_mode', defaults.embed_mode),
+            decision=form.get('decision', defaults.decision)
+        )
+
+class WatermarkDelta:
+    """Variation du signal produite par le watermark à force unité, limitée aux segments porteurs."""
+    def __init__(self, segment_length, segment_indices, rows):
+        self.segment_length = segment_length
+        self.segment_indices = segment_indices
+        self.rows = rows
+
+@functools.lru_cache(maxsize=KEY_SCHEDULE_CACHE_SIZE)
+def get_key_schedule(seed, num_segments, num_bits, band_lower, band_upper, n_coeffs, key_offset=0):
+    """Calcule une fois les tirages pseudo-aléatoires de la clé, sans toucher à l'état global de np.random.
+
+    Identique à np.random.seed(seed) + np.random.choice(num_segments, num_bits, replace=False) pour les
+    segments, et à RandomState(seed + key_offset + bit).choice(band, n_coeffs, replace=False) par bit.
+    """
+    if num_bits > num_segments:
+        raise ValueError("Pas assez de segments pour porter le watermark.")
+    if n_coeffs > band_upper - band_lower:
+        raise ValueError("La bande de fréquence est trop étroite pour le nombre de coefficients demandé.")
+    segment_indices = np.random.RandomState(seed).permutation(num_segments)[:num_bits].astype(np.int32)
+    return KeySchedule(segment_indices, get_key_coefficients(seed, num_bits, band_lower, band_upper, n_coeffs, key_offset))
+
+@functools.lru_cache(maxsize=KEY_SCHEDULE_CACHE_SIZE)
+def get_key_coefficients(seed, num_bits, band_lower, band_upper, n_coeffs, key_offset=0):
+    """Coefficients tirés pour chaque bit. Ils ne dépendent pas du nombre de segments : la recherche
+    de synchronisation, qui essaie un découpage par décalage, les partage entre découpages."""
+    coeff_indices = np.empty((num_bits, n_coeffs), dtype=np.int32)
+    band_width = band_upper - band_lower
+    for bit_idx in range(num_bits):
+        rng = np.random.RandomState(seed + key_offset + bit_idx)
+        coeff_indices[bit_idx] = band_lower + rng.permutation(band_width)[:n_coeffs]
+    return coeff_indices
+
+def dct_basis_rows(segment_length, band_lower, band_upper):
+    """Lignes band_lower..band_upper-1 de la matrice de DCT-II orthonormée : le coefficient k d'un
+    segment vaut <segment, ligne k - band_lower>. La phase est réduite en entier pour rester exacte."""
+    k = np.arange(band_lower, band_upper, dtype=np.int64)[:, None]
+    t = np.arange(segment_length, dtype=np.int64)
+    phase = (k * (2 * t + 1)) % (4 * segment_length)
+    rows = np.cos(np.pi * phase / (2 * segment_length)) * np.sqrt(2.0 / segment_length)
+    if band_lower == 0:
+        rows[0] *= np.sqrt(0.5)
+    return rows
+
+class BasisCache:
+    """Tables de vecteurs de base construites à la demande et partagées par les moteurs du processus.
+
+    LRU limité à max_bytes ; une table plus grande que la limite n'est pas construite (get renvoie
+    None et l'appelant repasse par les transformées). Les tables renvoyées sont en lecture seule.
+    """
+    def __init__(self, max_bytes=BASIS_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._tables = OrderedDict()
+        self._held = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, nbytes, build):
+        if nbytes > self.max_bytes:
+            return None
+        with self._lock:
+            if key in self._tables:
+                self._tables.move_to_end(key)
+                return self._tables[key]
+        table = build()
+        table.flags.writeable = False
+        with self._lock:
+            if key not in self._tables:
+                self._tables[key] = table
+                self._held += table.nbytes
+                while self._held > self.max_bytes:
+                    _, evicted = self._tables.popitem(last=False)
+                    self._held -= evicted.nbytes
+            return self._tables.get(key, table)
+
+basis_cache = BasisCache()
+
+class HammingCodec:
+    """Code de Hamming (7,4) vectorisé, blocs [p1, p2, d1, p3, d2, d3, d4].
+
+    Encodage : produit des quartets de données par la matrice génératrice, modulo 2. Décodage : les
+    syndromes de tous les blocs sont calculés d'un coup et une table donne le bit à corriger.
+    Les conversions octets <-> bits (poids fort en tête) passent par np.unpackbits/np.packbits.
+    """
+    # Ligne i : contribution du bit de données d(i+1) à chacune des 7 positions du bloc
+    GENERATOR = np.array([
+        [1, 1, 1, 0, 0, 0, 0],
+        [1, 0, 0, 1, 1, 0, 0],
+        [0, 1, 0, 1, 0, 1, 0],
+        [1, 1, 0, 1, 0, 0, 1],
+    ], dtype=np.uint8)
+    # Contrôles c1, c2, c3 : le syndrome c1 + 2 c2 + 4 c3 est la position (1 à 7) du bit erroné
+    PARITY_CHECK = np.array([
+        [1, 0, 1, 0, 1, 0, 1],
+        [0, 1, 1, 0, 0, 1, 1],
+        [0, 0, 0, 1, 1, 1, 1],
+    ], dtype=np.uint8)
+    SYNDROME_WEIGHTS = np.array([1, 2, 4])
+    # Ligne s : masque du bit à inverser pour le syndrome s (aucun pour 0)
+    SYNDROME_TABLE = np.vstack([np.zeros(7), np.eye(7)]).astype(np.uint8)
+    DATA_POSITIONS = [2, 4, 5, 6]
+    # Les 16 quartets de données et leurs mots de code en ±1, pour le décodage à entrée souple
+    NIBBLES = ((np.arange(16)[:, None] >> np.arange(3, -1, -1)) & 1).astype(np.uint8)
+    CODEWORD_SIGNS = 2.0 * (NIBBLES @ GENERATOR % 2) - 1.0
+
+    @staticmethod
+    def bytes_to_bits(data):
+        return np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8))
+
+    @staticmethod
+    def bits_to_bytes(bits):
+        # Les bits au-delà du dernier octet complet sont ignorés
+        bits = np.asarray(bits, dtype=np.uint8)
+        return np.packbits(bits[:len(bits) // 8 * 8]).tobytes()
+
+    def encode(self, bits):
+        """Bits de données, complétés par des zéros jusqu'à un multiple de 4 -> bits codés (uint8)."""
+        bits = np.asarray(bits, dtype=np.uint8)
+        bits = np.concatenate([bits, np.zeros(-len(bits) % 4, dtype=np.uint8)])
+        return (bits.reshape(-1, 4) @ self.GENERATOR % 2).astype(np.uint8).ravel()
+
+    def decode(self, bits):
+        """Bits codés (multiple de 7) -> bits de données, une erreur corrigée par bloc."""
+        bits = np.asarray(bits, dtype=np.uint8)
+        if len(bits) % 7 != 0:
+            raise ValueError("La longueur des bits encodés doit être un multiple de 7")
+        blocks = bits.reshape(-1, 7)
+        syndromes = (blocks @ self.PARITY_CHECK.T % 2) @ self.SYNDROME_WEIGHTS
+        return (blocks ^ self.SYNDROME_TABLE[syndromes])[:, self.DATA_POSITIONS].ravel()
+
+    def decode_soft(self, llr):
+        """Décodage à entrée souple : LLR des bits codés (positif : bit 1, multiple de 7) ->
+        (bits de données du mot de code le plus vraisemblable, LLR max-log de chaque bit de données).
+
+        La vraisemblance d'un mot de code est la corrélation des LLR avec ses bits en ±1 ; le LLR d'un
+        bit de données est l'écart entre le meilleur mot où il vaut 1 et le meilleur où il vaut 0.
+        """
+        llr = np.asarray(llr, dtype=np.float64)
+        if len(llr) % 7 != 0:
+            raise ValueError("La longueur des bits encodés doit être un multiple de 7")
+        metrics = llr.reshape(-1, 7) @ self.CODEWORD_SIGNS.T / 2
+        bits = self.NIBBLES[np.argmax(metrics, axis=1)].ravel()
+        data_llr = np.empty((len(metrics), 4))
+        for position in range(4):
+            ones = self.NIBBLES[:, position] == 1
+            data_llr[:, position] = metrics[:, ones].max(axis=1) - metrics[:, ~ones].max(axis=1)
+        return bits, data_llr.ravel()
 
 class AudioWatermarker:
-    def __init__(self):
-        self.segment_length = 2048
-        self.seed = 42
-        self.modulation_strength = 0.005
-        self.band_lower_pct = 33
-        self.band_upper_pct = 66
-        self.dwt_level = 1
-        self.dwt_wavelet = 'haar'
-        self.dwt_coeff_type = 'cA'
-        self.n_coeffs = 5
+    def __init__(self, params=None, progress=None):
+        # Paramètres figés pour la durée de vie du moteur : une instance par requête, jamais modifiée ensuite
+        self.params = params if params is not None else WatermarkParams()
+        # progress(pourcentage) est appelé depuis les boucles du moteur (tâches asynchrones)
+        self.progress = progress
+        self.transform_workers = TRANSFORM_WORKERS
+        self.batch_segments = TRANSFORM_BATCH_SEGMENTS
+        self.codec = HammingCodec()
+
+    def _report_progress(self, value):
+        if self.progress is not None:
+            self.progress(int(value))
 
     def audio_to_numpy(self, audio_source):
-        fmt = get_audio_format(audio_source)
+        """Décode un chemin ou un fichier ouvert en float32 mono dans [-1, 1).
+
+        Le format est reconnu au contenu. Le PCM 16, 24 et 32 bits WAV/FLAC/AIFF est lu par soundfile,
+        sans ffmpeg ; les autres entrées passent par pydub, format déduit de l'extension. Comme avec
+        pydub, les échantillons entiers sont divisés par 32768 quelle que soit la résolution.
+        """
+        fmt = sniff_audio_format(read_audio_header(audio_source))
+        if fmt is not None:
+            decoded = self._read_pcm(audio_source)
+            if decoded is not None:
+                return decoded[0], decoded[1], fmt
+        else:
+            fmt = get_audio_format(audio_source) if isinstance(audio_source, str) else None
         if fmt is None:
             raise ValueError("Format de fichier non supporté.")
         audio_seg = AudioSegment.from_file(audio_source, format=fmt)
@@ -622,9 +1445,35 @@ class AudioWatermarker:
         samples /= 32768.0
         return samples, audio_seg.frame_rate, fmt
 
+    def _read_pcm(self, audio_source):
+        """Lit un fichier PCM 16/24/32 bits par blocs dans un tableau float32 préalloué, mixé en mono
+        comme pydub. Renvoie (échantillons, fréquence), ou None pour une autre résolution (repli pydub)."""
+        with sf.SoundFile(audio_source) as f:
+            dtype = SOUNDFILE_READ_DTYPES.get(f.subtype)
+            if dtype is None:
+                if not isinstance(audio_source, str):
+                    audio_source.seek(0)
+                return None
+            samples = np.empty(f.frames, dtype=np.float32)
+            position = 0
+            for block in f.blocks(blocksize=INGEST_BLOCK_FRAMES, dtype=dtype, always_2d=True):
+                if f.subtype == 'PCM_24':
+                    # pydub complète l'octet de poids faible des échantillons négatifs par 0xFF
+                    block |= (block >> 31) & 0xFF
+                mono = self._downmix_pcm(block)
+                samples[position:position + len(mono)] = mono
+                position += len(mono)
+            sample_rate = f.samplerate
+        samples = samples[:position]
+        samples /= 32768.0
+        return samples, sample_rate
+
     def numpy_to_audio_bytes(self, samples, sample_rate, fmt):
-        samples = np.clip(samples, -1, 1)
-        samples = (samples * 32768).astype(np.int16)
+        samples = self._to_pcm16(samples)
+        if fmt in SOUNDFILE_FORMATS:
+            buffer = io.BytesIO()
+            self._write_lossless(buffer, samples, sample_rate, fmt)
+            return buffer.getvalue()
         audio_seg = AudioSegment(
             samples.tobytes(),
             frame_rate=sample_rate,
@@ -634,13 +1483,16 @@ class AudioWatermarker:
         buffer = io.BytesIO()
         export_kwargs = {}
         if fmt in LOSSY_FORMATS:
-            export_kwargs["bitrate"] = "320k"
+            export_kwargs["bitrate"] = LOSSY_BITRATE
         audio_seg.export(buffer, format=fmt, **export_kwargs)
         return buffer.getvalue()
 
     def numpy_to_audio(self, samples, sample_rate, output_path, fmt):
-        samples = np.clip(samples, -1, 1)
-        samples = (samples * 32768).astype(np.int16)
+        samples = self._to_pcm16(samples)
+        if fmt in SOUNDFILE_FORMATS:
+            with open(output_path, 'wb') as output_file:
+                self._write_lossless(output_file, samples, sample_rate, fmt)
+            return
         audio_seg = AudioSegment(
             samples.tobytes(),
             frame_rate=sample_rate,
@@ -649,7 +1501,7 @@ class AudioWatermarker:
         )
         export_kwargs = {}
         if fmt in LOSSY_FORMATS:
-            export_kwargs["bitrate"] = "320k"
+            export_kwargs["bitrate"] = LOSSY_BITRATE
         audio_seg.export(output_path, format=fmt, **export_kwargs)
 
     def audio_bytes_to_numpy(self, audio_bytes, fmt):
@@ -660,59 +1512,362 @@ class AudioWatermarker:
         os.remove(tmp_path)
         return samples, sr
 
+    @staticmethod
+    def _write_lossless(target, pcm, sample_rate, fmt):
+        """Écrit du PCM 16 bits mono en WAV/FLAC/AIFF dans un fichier ouvert, sans ffmpeg.
+
+        Le WAV est un en-tête RIFF de 44 octets suivi du tampon numpy lui-même (aucune copie sur
+        une machine little-endian), identique octet pour octet à ce qu'écrit soundfile ;
+        FLAC et AIFF sont encodés par soundfile.
+        """
+        data_size = pcm.size * 2
+        if fmt != "wav" or data_size > 0xFFFFFFFF - 36:
+            sf.write(target, pcm, sample_rate, format=SOUNDFILE_FORMATS[fmt], subtype='PCM_16')
+            return
+        target.write(struct.pack(
+            '<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + data_size, b'WAVE', b'fmt ', 16, 1, 1,
+            sample_rate, sample_rate * 2, 2, 16, b'data', data_size
+        ))
+        target.write(memoryview(pcm.astype('<i2', copy=False)).cast('B'))
+
+    @staticmethod
+    def _to_pcm16(samples):
+        samples = np.clip(samples, -1, 1)
+        return (samples * 32768).astype(np.int16)
+
+    def _run_ffmpeg(self, args, input_bytes):
+        # stdin -> ffmpeg -> stdout, sans fichier intermédiaire
+        command = [AudioSegment.converter, '-hide_banner', '-loglevel', 'error'] + args
+        result = subprocess.run(command, input=input_bytes, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg a échoué (code {result.returncode}) : {result.stderr.decode(errors='ignore')}")
+        return result.stdout
+
+    def _encode_pipe(self, pcm, sample_rate, fmt):
+        args = ['-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', 'pipe:0']
+        codec = AudioSegment.DEFAULT_CODECS.get(fmt)
+        if codec:
+            args += ['-acodec', codec]
+        args += ['-b:a', LOSSY_BITRATE, '-f', FFMPEG_PIPE_MUXERS[fmt], 'pipe:1']
+        return self._run_ffmpeg(args, pcm.tobytes())
+
+    def _decode_pipe(self, audio_bytes, sample_rate):
+        # Relu à la fréquence d'origine (opus est toujours décodé à 48 kHz sinon)
+        args = ['-i', 'pipe:0', '-vn', '-ac', '1', '-ar', str(sample_rate), '-acodec', 'pcm_s16le', '-f', 's16le', 'pipe:1']
+        return np.frombuffer(self._run_ffmpeg(args, audio_bytes), dtype=np.int16)
+
+    def codec_round_trip(self, samples, sample_rate, fmt):
+        """Encode `samples` dans `fmt` puis relit le résultat, entièrement en mémoire.
+
+        WAV/FLAC/AIFF passent par soundfile et le signal relu est exactement le PCM 16 bits écrit ;
+        les formats lossy passent par un ffmpeg sur stdin/stdout pour l'encodage et pour le décodage.
+        Retourne (octets encodés, signal relu en float32).
+        """
+        pcm = self._to_pcm16(samples)
+        if fmt in SOUNDFILE_FORMATS:
+            buffer = io.BytesIO()
+            self._write_lossless(buffer, pcm, sample_rate, fmt)
+            return buffer.getvalue(), pcm.astype(np.float32) / 32768.0
+        if fmt in FFMPEG_PIPE_MUXERS:
+            audio_bytes = self._encode_pipe(pcm, sample_rate, fmt)
+            decoded = self._decode_pipe(audio_bytes, sample_rate)
+            return audio_bytes, decoded.astype(np.float32) / 32768.0
+        audio_bytes = self.numpy_to_audio_bytes(samples, sample_rate, fmt)
+        decoded, _ = self.audio_bytes_to_numpy(audio_bytes, fmt)
+        return audio_bytes, decoded
+
     # -------------- Hamming 7,4 --------------
+    # Interface historique par listes, déléguée au codec vectorisé
     def hamming_encode_bitblock(self, nibble):
         if len(nibble) != 4:
             raise ValueError("La taille du bloc doit être de 4 bits")
-        d1, d2, d3, d4 = nibble
-        p1 = d1 ^ d2 ^ d4
-        p2 = d1 ^ d3 ^ d4
-        p3 = d2 ^ d3 ^ d4
-        return [p1, p2, d1, p3, d2, d3, d4]
+        return self.codec.encode(nibble).tolist()
 
     def hamming_decode_bitblock(self, block):
         if len(block) != 7:
             raise ValueError("La taille du bloc doit être de 7 bits")
-        p1, p2, d1, p3, d2, d3, d4 = block
-        c1 = p1 ^ d1 ^ d2 ^ d4
-        c2 = p2 ^ d1 ^ d3 ^ d4
-        c3 = p3 ^ d2 ^ d3 ^ d4
-        syndrome = (c1 * 1) + (c2 * 2) + (c3 * 4)
-        if syndrome > 0:
-            if syndrome == 1:    p1 = 1 - p1
-            elif syndrome == 2:  p2 = 1 - p2
-            elif syndrome == 3:  d1 = 1 - d1
-            elif syndrome == 4:  p3 = 1 - p3
-            elif syndrome == 5:  d2 = 1 - d2
-            elif syndrome == 6:  d3 = 1 - d3
-            elif syndrome == 7:  d4 = 1 - d4
-        return [d1, d2, d3, d4]
+        return self.codec.decode(block).tolist()
 
     def hamming_encode_bitstring(self, bit_list):
-        if len(bit_list) % 4 != 0:
-            padding = 4 - (len(bit_list) % 4)
-            bit_list.extend([0] * padding)
-        encoded = []
-        for i in range(0, len(bit_list), 4):
-            nibble = bit_list[i:i+4]
-            encoded.extend(self.hamming_encode_bitblock(nibble))
-        return encoded
+        return self.codec.encode(bit_list).tolist()
 
     def hamming_decode_bitstring(self, encoded_bits):
-        if len(encoded_bits) % 7 != 0:
-            raise ValueError("La longueur des bits encodés doit être un multiple de 7")
-        decoded = []
-        for i in range(0, len(encoded_bits), 7):
-            block = encoded_bits[i:i+7]
-            if len(block) == 7:
-                decoded.extend(self.hamming_decode_bitblock(block))
-        return decoded
+        return self.codec.decode(encoded_bits).tolist()
 
     def get_coeff_indices(self, band_lower, band_upper, n, key):
         rng = np.random.RandomState(key)
         indices = rng.choice(np.arange(band_lower, band_upper), size=n, replace=False)
         return indices
 
+    def _key_schedule(self, seed, num_segments, num_bits, band_length, key_offset=0):
+        # band_length : longueur du vecteur DCT modulé (segment pour DCT, sous-bande pour DWT-DCT)
+        band_lower, band_upper = self._band_bounds(band_length)
+        return get_key_schedule(seed, num_segments, num_bits, band_lower, band_upper, self.params.n_coeffs, key_offset)
+
+    def _band_bounds(self, band_length):
+        # Plage [band_lower, band_upper) des coefficients DCT où la clé choisit les coefficients modulés
+        return int(band_length * self.params.band_lower_pct / 100), int(band_length * self.params.band_upper_pct / 100)
+
+    def _dct_basis(self, segment_length):
+        """(band_lower, lignes de DCT de la bande) pour segment_length, depuis le cache du processus ;
+        lignes à None si la table dépasse BASIS_CACHE_BYTES."""
+        band_lower, band_upper = self._band_bounds(segment_length)
+        nbytes = (band_upper - band_lower) * segment_length * 8
+        rows = basis_cache.get(
+            ('dct', segment_length, band_lower, band_upper), nbytes,
+            lambda: dct_basis_rows(segment_length, band_lower, band_upper)
+        )
+        return band_lower, rows
+
+    @staticmethod
+    def _project_coeffs(segments, coeff_indices, basis):
+        """Coefficients choisis (une ligne par segment) par produits scalaires avec les lignes de détection
+        de la bande (DCT, ou chaîne DWT-DCT) : n_coeffs x L opérations par segment, sans transformée."""
+        band_lower, rows = basis
+        # Regroupement par coefficient : chaque ligne de base est lue une fois par lot et multipliée
+        # (en float64, mêmes signes que la DCT complète) par tous les segments qui l'utilisent
+        coeff_indices = np.asarray(coeff_indices)
+        flat = coeff_indices.ravel()
+        order = np.argsort(flat, kind='stable')
+        keys = flat[order]
+        # Table construite pour une autre bande : un indice négatif relirait silencieusement une autre ligne
+        if len(keys) and (keys[0] < band_lower or keys[-1] >= band_lower + len(rows)):
+            raise ValueError("Coefficients hors de la bande de la table de projection")
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        ends = np.r_[starts[1:], len(keys)]
+        owners = order // coeff_indices.shape[1]
+        selected = np.empty(len(flat))
+        for start, end in zip(starts, ends):
+            selected[order[start:end]] = segments[owners[start:end]].astype(np.float64) @ rows[keys[start] - band_lower]
+        return selected.reshape(coeff_indices.shape)
+
+    def _dwt_basis(self, segment_length, dwt_level, dwt_wavelet, dwt_coeff_type, kind):
+        """(band_lower, vecteurs) de la chaîne DWT-DCT, linéaire à configuration d'ondelette fixée, pour
+        la bande de la clé. kind "detect" : le coefficient k d'un segment vaut <segment, vecteur> ;
+        kind "embed" : effet temporel de +1 sur le coefficient k. Construits au premier usage puis gardés
+        dans le cache LRU du processus ; vecteurs à None si la table dépasse BASIS_CACHE_BYTES."""
+        band_lower, band_upper = self._band_bounds(self._dwt_subband_length(segment_length, dwt_level, dwt_wavelet))
+        build = self._dwt_detection_rows if kind == "detect" else self._dwt_embedding_rows
+        rows = basis_cache.get(
+            (kind, segment_length, dwt_level, dwt_wavelet, dwt_coeff_type, band_lower, band_upper),
+            (band_upper - band_lower) * segment_length * 8,
+            lambda: build(segment_length, dwt_level, dwt_wavelet, dwt_coeff_type, band_lower, band_upper)
+        )
+        return band_lower, rows
+
+    def _dwt_embedding_rows(self, segment_length, dwt_level, dwt_wavelet, dwt_coeff_type, band_lower, band_upper):
+        # Ligne k : waverec de la sous-bande IDCT(e_k), les autres sous-bandes nulles
+        band_length = self._dwt_subband_length(segment_length, dwt_level, dwt_wavelet)
+        rows = np.empty((band_upper - band_lower, segment_length))
+        for first in range(band_lower, band_upper, self.batch_segments):
+            count = min(self.batch_segments, band_upper - first)
+            unit = np.zeros((count, band_length))
+            unit[np.arange(count), first + np.arange(count)] = 1.0
+            coeffs = pywt.wavedec(np.zeros((count, segment_length)), dwt_wavelet, level=dwt_level, axis=-1)
+            coeffs[0 if dwt_coeff_type == 'cA' else 1] = sp_fft.idct(unit, norm='ortho', axis=-1, workers=self.transform_workers)
+            rows[first - band_lower:first - band_lower + count] = pywt.waverec(coeffs, dwt_wavelet, axis=-1)[:, :segment_length]
+        return rows
+
+    def _embed_segments_dct(self, audio, segment_length, schedule, signs, modulation_strength):
+        """Module tous les segments sélectionnés par lots : une DCT/IDCT le long du dernier axe
+        et une seule addition indexée par lot, puis réécriture des segments dans le signal.
+        En mode "basis", passe par _embed_segments_basis, sans transformée."""
+        basis = self._embed_basis(segment_length, "DCT")
+        if basis is not None:
+            return self._embed_segments_basis(audio, segment_length, schedule, signs, modulation_strength, basis)
+        audio_watermarked = np.copy(audio)
+        frames = self._segment_frames(audio_watermarked, segment_length)
+        segment_indices = schedule.segment_indices
+        coeff_indices = schedule.coeff_indices
+        modulation = modulation_strength * np.asarray(signs)
+        for first in range(0, len(segment_indices), self.batch_segments):
+            last = first + self.batch_segments
+            batch = segment_indices[first:last]
+            segments = frames[batch].astype(np.float64)
+            coeffs = sp_fft.dct(segments, norm='ortho', axis=-1, workers=self.transform_workers)
+            rows = np.arange(len(batch))[:, None]
+            coeffs[rows, coeff_indices[first:last]] += modulation[first:last, None]
+            frames[batch] = sp_fft.idct(coeffs, norm='ortho', axis=-1, workers=self.transform_workers).astype(np.float32)
+        return audio_watermarked
+
+    def _embed_basis(self, segment_length, method, dwt_level=None, dwt_wavelet=None, dwt_coeff_type=None):
+        # Vecteurs d'insertion directe (mode "basis"), None pour passer par les transformées
+        if self.params.embed_mode != "basis":
+            return None
+        if method == "DCT":
+            basis = self._dct_basis(segment_length)
+        else:
+            basis = self._dwt_basis(segment_length, dwt_level, dwt_wavelet, dwt_coeff_type, "embed")
+        return basis if basis[1] is not None else None
+
+    @staticmethod
+    def _basis_patterns(coeff_indices, weights, basis):
+        # Motif temporel de chaque bit : poids x somme de ses vecteurs de base (IDCT du motif ±1, sans transformée)
+        first_row, rows = basis
+        return rows[np.asarray(coeff_indices) - first_row].sum(axis=1) * np.asarray(weights, dtype=np.float64)[:, None]
+
+    def _embed_segments_basis(self, audio, segment_length, schedule, signs, modulation_strength, basis):
+        """Insertion dans le domaine temporel : ajouter ±s à n_coeffs coefficients puis revenir au signal
+        (IDCT, et waverec pour DWT-DCT) revient à ajouter ±s fois la somme des vecteurs d'insertion
+        correspondants. Les segments porteurs sont modifiés en place dans le signal de sortie ; égal au
+        chemin par transformées à l'arrondi float32 près."""
+        audio_watermarked = np.copy(audio)
+        frames = self._segment_frames(audio_watermarked, segment_length)
+        modulation = modulation_strength * np.asarray(signs, dtype=np.float64)
+        for first in range(0, len(schedule), BASIS_BATCH_SEGMENTS):
+            last = first + BASIS_BATCH_SEGMENTS
+            patterns = self._basis_patterns(schedule.coeff_indices[first:last], modulation[first:last], basis)
+            frames[schedule.segment_indices[first:last]] += patterns.astype(np.float32)
+        return audio_watermarked
+
+    def _segment_frames(self, audio, segment_length):
+        # Vue (num_segments, segment_length) sur le signal, sans copie quand le signal est contigu
+        audio = np.asarray(audio)
+        num_segments = len(audio) // segment_length
+        return audio[:num_segments * segment_length].reshape(num_segments, segment_length)
+
+    @staticmethod
+    def _vote_selected(selected):
+        # Vote par signe des coefficients choisis, puis décision à la majorité (égalité -> 1)
+        votes = np.where(selected >= 0, 1, -1).sum(axis=1)
+        return (votes >= 0).astype(np.uint8)
+
+    @staticmethod
+    def _majority_bits(extracted_bits, redundancy, rep_length):
+        # Vote majoritaire sur les copies redondantes (une ligne par copie)
+        copies = np.asarray(extracted_bits).reshape((redundancy, rep_length))
+        return (copies.sum(axis=0) >= (redundancy / 2.0)).astype(np.uint8)
+
+    @staticmethod
+    def _bits_to_bytes(bits):
+        return HammingCodec.bits_to_bytes(bits)
+
+    @staticmethod
+    def _dwt_subband_length(segment_length, dwt_level, dwt_wavelet):
+        # cA et cD du niveau le plus grossier ont la même longueur
+        return len(pywt.wavedec(np.zeros(segment_length), dwt_wavelet, level=dwt_level)[0])
+
+    def _dwt_dct_coeffs(self, segments, dwt_level, dwt_wavelet, dwt_coeff_type):
+        # Décomposition DWT de toutes les lignes, puis DCT de la sous-bande choisie (cA ou cD du dernier niveau)
+        coeffs = pywt.wavedec(segments, dwt_wavelet, level=dwt_level, axis=-1)
+        slot = 0 if dwt_coeff_type == 'cA' else 1
+        c_mod = sp_fft.dct(coeffs[slot], norm='ortho', axis=-1, workers=self.transform_workers)
+        return coeffs, slot, c_mod
+
+    def _embed_segments_dwt_dct(self, audio, segment_length, schedule, signs, modulation_strength, dwt_level, dwt_wavelet, dwt_coeff_type):
+        """Variante DWT-DCT de _embed_segments_dct : wavedec/waverec le long du dernier axe pour tout le lot.
+        En mode "basis", passe par _embed_segments_basis avec les vecteurs de la configuration d'ondelette."""
+        basis = self._embed_basis(segment_length, "DWT-DCT", dwt_level, dwt_wavelet, dwt_coeff_type)
+        if basis is not None:
+            return self._embed_segments_basis(audio, segment_length, schedule, signs, modulation_strength, basis)
+        audio_watermarked = np.copy(audio)
+        frames = self._segment_frames(audio_watermarked, segment_length)
+        segment_indices = schedule.segment_indices
+        coeff_indices = schedule.coeff_indices
+        modulation = modulation_strength * np.asarray(signs)
+        for first in range(0, len(segment_indices), self.batch_segments):
+            last = first + self.batch_segments
+            batch = segment_indices[first:last]
+            segments = frames[batch].astype(np.float64)
+            coeffs, slot, c_mod = self._dwt_dct_coeffs(segments, dwt_level, dwt_wavelet, dwt_coeff_type)
+            rows = np.arange(len(batch))[:, None]
+            c_mod[rows, coeff_indices[first:last]] += modulation[first:last, None]
+            coeffs[slot] = sp_fft.idct(c_mod, norm='ortho', axis=-1, workers=self.transform_workers)
+            segments_mod = pywt.waverec(coeffs, dwt_wavelet, axis=-1)[:, :segment_length]
+            frames[batch] = segments_mod.astype(np.float32)
+        return audio_watermarked
+
+    def _iter_selected_coeffs(self, method, audio, segment_length, schedule, dwt_level=None, dwt_wavelet=None, dwt_coeff_type=None):
+        """Parcourt les segments porteurs par lots : (tranche des bits, segments, coefficients choisis).
+
+        Projection sur les lignes de détection en cache (DCT, ou chaîne DWT-DCT de la configuration
+        d'ondelette) ; sans table, transformée complète du lot.
+        """
+        if method == "DCT":
+            basis = self._dct_basis(segment_length)
+        else:
+            basis = self._dwt_basis(segment_length, dwt_level, dwt_wavelet, dwt_coeff_type, "detect")
+        frames = self._segment_frames(audio, segment_length)
+        segment_indices = schedule.segment_indices
+        coeff_indices = schedule.coeff_indices
+        for first in range(0, len(segment_indices), self.batch_segments):
+            batch = slice(first, first + self.batch_segments)
+            segments = frames[segment_indices[batch]]
+            if basis[1] is not None:
+                selected = self._project_coeffs(segments, coeff_indices[batch], basis)
+            else:
+                if method == "DCT":
+                    coeffs = sp_fft.dct(segments.astype(np.float64), norm='ortho', axis=-1, workers=self.transform_workers)
+                else:
+                    _, _, coeffs = self._dwt_dct_coeffs(segments.astype(np.float64), dwt_level, dwt_wavelet, dwt_coeff_type)
+                selected = np.take_along_axis(coeffs, np.asarray(coeff_indices[batch]), axis=1)
+            yield batch, segments, selected
+
+    def _extract_bits_dct(self, audio, segment_length, schedule):
+        return self._extract_bits("DCT", audio, segment_length, schedule)
+
+    def _extract_bits_dwt_dct(self, audio, segment_length, schedule, dwt_level, dwt_wavelet, dwt_coeff_type):
+        return self._extract_bits("DWT-DCT", audio, segment_length, schedule, dwt_level, dwt_wavelet, dwt_coeff_type)
+
+    def _extract_bits(self, method, audio, segment_length, schedule, dwt_level=None, dwt_wavelet=None, dwt_coeff_type=None):
+        # Décision dure : un bit par segment, majorité des signes de ses coefficients
+        bits = np.empty(len(schedule), dtype=np.uint8)
+        for batch, _, selected in self._iter_selected_coeffs(method, audio, segment_length, schedule, dwt_level, dwt_wavelet, dwt_coeff_type):
+            bits[batch] = self._vote_selected(selected)
+        return bits
+
+    def _extract_llr(self, method, audio, segment_length, schedule, modulation_strength, dwt_level=None, dwt_wavelet=None, dwt_coeff_type=None):
+        """LLR de chaque bit porté (positif : bit 1), à partir des corrélations brutes.
+
+        Chaque coefficient vaut ±s plus l'hôte, supposé gaussien de variance σ² par segment ; σ² est
+        estimée par l'énergie moyenne du segment (Parseval). Un coefficient c apporte 2 s c / σ²,
+        sommé sur les n_coeffs coefficients du bit. L'échelle s ne change que les confiances.
+        """
+        llr = np.empty(len(schedule))
+        for batch, segments, selected in self._iter_selected_coeffs(method, audio, segment_length, schedule, dwt_level, dwt_wavelet, dwt_coeff_type):
+            energy = np.einsum('ij,ij->i', segments, segments, dtype=np.float64) / segment_length
+            llr[batch] = 2 * modulation_strength * selected.sum(axis=1) / np.maximum(energy, np.finfo(np.float64).tiny)
+        return llr
+
+    def _decode_short_payload(self, bits):
+        # Watermark court : bits bruts, sans CRC ni Hamming
+        watermark_bytes = self._bits_to_bytes(bits)
+        try:
+            watermark_str = watermark_bytes.decode('utf-8', errors='replace')
+        except UnicodeDecodeError:
+            watermark_str = "Erreur de décodage (UTF-8, court)"
+        return watermark_str
+
+    def _decode_crc_payload(self, final_bits, total_data_bits):
+        watermark_str, crc_valid = self._check_crc_payload(final_bits, total_data_bits)
+        self._report_crc(crc_valid)
+        return watermark_str
+
+    @staticmethod
+    def _report_crc(crc_valid):
+        if not crc_valid:
+            print("Attention : CRC non vérifié, le watermark extrait peut être incorrect.")
+        else:
+            print("CRC vérifié avec succès.")
+
+    def _check_crc_payload(self, final_bits, total_data_bits):
+        # Décodage Hamming puis contrôle du CRC32 : (texte, CRC valide)
+        return self._check_crc_message(self.codec.decode(final_bits)[:total_data_bits])
+
+    def _check_crc_message(self, decoded_bits):
+        # Message suivi de son CRC32 (bits de données décodés) : (texte, CRC valide)
+        watermark_bytes = self._bits_to_bytes(decoded_bits)
+        if len(watermark_bytes) < 4:
+            raise ValueError("Watermark décodé trop court.")
+        message = watermark_bytes[:-4]
+        crc_extracted = watermark_bytes[-4:]
+        crc_calculated = zlib.crc32(message).to_bytes(4, 'big')
+        try:
+            watermark_str = message.decode('utf-8')
+        except UnicodeDecodeError:
+            watermark_str = "Erreur de décodage (UTF-8)"
+        return watermark_str, crc_extracted == crc_calculated
+
     def _auto_segment_length(self, audio_len, bits_needed):
         # Cherche la plus petite puissance de 2 qui permet de caser bits_needed dans audio_len/segment_length
         for seglen in [512, 1024, 2048, 4096, 8192, 16384]:
@@ -721,401 +1876,756 @@ class AudioWatermarker:
         # Si vraiment trop court, prend le max possible
         return max(128, audio_len // bits_needed)
 
-    def embed_watermark(self, audio, watermark, segment_length=None, seed=None, modulation_strength=None):
-        segment_length = segment_length or self.segment_length
-        seed = seed or self.seed
-        modulation_strength = modulation_strength or self.modulation_strength
-        n_coeffs = self.n_coeffs
+    def _embed_plan(self, audio_len, watermark, segment_length):
+        """Bits à insérer (±1) et longueur de segment effective pour un signal de audio_len échantillons.
 
+        Avec assez de segments : message + CRC32, Hamming(7,4), répété autant que possible.
+        Sinon : message seul (sans CRC ni Hamming) avec une longueur de segment réduite.
+        """
         watermark_bytes = watermark.encode('utf-8')
         crc = zlib.crc32(watermark_bytes).to_bytes(4, 'big')
-        watermark_with_crc = watermark_bytes + crc
-        wm_bits = []
-        for byte in watermark_with_crc:
-            for i in range(7, -1, -1):
-                wm_bits.append(1 if (byte >> i) & 1 else 0)
-        encoded_bits = self.hamming_encode_bitstring(wm_bits)
+        encoded_bits = self.codec.encode(self.codec.bytes_to_bits(watermark_bytes + crc))
         rep_length = len(encoded_bits)
-        num_segments = len(audio) // segment_length
+        num_segments = audio_len // segment_length
         redundancy = num_segments // rep_length
 
         if redundancy < 1:
             # Watermark direct (sans CRC ni Hamming)
-            wm_bits = []
-            for byte in watermark_bytes:
-                for i in range(7, -1, -1):
-                    wm_bits.append(1 if (byte >> i) & 1 else 0)
+            wm_bits = self.codec.bytes_to_bits(watermark_bytes)
             bits_needed = len(wm_bits)
-            segment_length = self._auto_segment_length(len(audio), bits_needed)
-            num_segments = len(audio) // segment_length
+            segment_length = self._auto_segment_length(audio_len, bits_needed)
+            num_segments = audio_len // segment_length
             if num_segments < bits_needed:
                 raise ValueError("Le signal est trop court pour contenir le watermark, même sans correction d'erreur.")
-            np.random.seed(seed)
-            segment_indices = np.random.choice(np.arange(num_segments), size=bits_needed, replace=False)
-            band_lower = int(segment_length * self.band_lower_pct / 100)
-            band_upper = int(segment_length * self.band_upper_pct / 100)
-            audio_watermarked = np.copy(audio)
-            for bit_idx, (seg_idx, bit) in enumerate(zip(segment_indices, wm_bits)):
-                start = seg_idx * segment_length
-                end = start + segment_length
-                segment = audio[start:end]
-                segment = np.array(segment, dtype=np.float64)
-                coeffs = dct(segment, norm='ortho')
-                coeff_indices = self.get_coeff_indices(band_lower, band_upper, n_coeffs, bit_idx + seed)
-                for idx in coeff_indices:
-                    coeffs[idx] += modulation_strength * (1 if bit == 1 else -1)
-                audio_watermarked[start:end] = idct(coeffs, norm='ortho').astype(np.float32)
-            return audio_watermarked
-        else:
-            watermark_bits_full = encoded_bits * redundancy
-            watermark_mod = [1 if bit == 1 else -1 for bit in watermark_bits_full]
-            np.random.seed(seed)
-            segment_indices = np.random.choice(np.arange(num_segments), size=len(watermark_mod), replace=False)
-            band_lower = int(segment_length * self.band_lower_pct / 100)
-            band_upper = int(segment_length * self.band_upper_pct / 100)
-            audio_watermarked = np.copy(audio)
-            for bit_idx, (seg_idx, bit) in enumerate(zip(segment_indices, watermark_mod)):
-                start = seg_idx * segment_length
-                end = start + segment_length
-                segment = audio[start:end]
-                segment = np.array(segment, dtype=np.float64)
-                coeffs = dct(segment, norm='ortho')
-                coeff_indices = self.get_coeff_indices(band_lower, band_upper, n_coeffs, bit_idx + seed)
-                for idx in coeff_indices:
-                    coeffs[idx] += modulation_strength * bit
-                audio_watermarked[start:end] = idct(coeffs, norm='ortho').astype(np.float32)
-            return audio_watermarked
+            return segment_length, 2 * wm_bits.astype(np.int8) - 1
+        return segment_length, 2 * np.tile(encoded_bits, redundancy).astype(np.int8) - 1
 
-    def extract_watermark(self, audio, watermark_message_length, segment_length=None, seed=None, modulation_strength=None):
-        segment_length = segment_length or self.segment_length
-        seed = seed or self.seed
-        n_coeffs = self.n_coeffs
+    def _method_schedule(self, method, seed, audio_len, segment_length, num_bits, dwt_level=None, dwt_wavelet=None):
+        num_segments = audio_len // segment_length
+        if method == "DCT":
+            return self._key_schedule(seed, num_segments, num_bits, segment_length)
+        subband_length = self._dwt_subband_length(segment_length, dwt_level, dwt_wavelet)
+        return self._key_schedule(seed, num_segments, num_bits, subband_length, 123)
+
+    def embed_watermark(self, audio, watermark, segment_length=None, seed=None, modulation_strength=None):
+        segment_length = segment_length or self.params.segment_length
+        seed = seed or self.params.seed
+        modulation_strength = modulation_strength or self.params.modulation_strength
 
+        segment_length, signs = self._embed_plan(len(audio), watermark, segment_length)
+        schedule = self._method_schedule("DCT", seed, len(audio), segment_length, len(signs))
+        return self._embed_segments_dct(audio, segment_length, schedule, signs, modulation_strength)
+
+    def _extract_plan(self, audio_len, watermark_message_length, segment_length):
+        """Découpage attendu à l'extraction : (segment_length, redondance, rep_length, total_data_bits).
+
+        Une redondance nulle désigne le watermark court (bits bruts, sans CRC ni Hamming) :
+        rep_length est alors le nombre de bits bruts et segment_length la longueur réduite.
+        """
         message_bytes_length = watermark_message_length + 4
         bits_per_byte = 8
         total_data_bits = message_bytes_length * bits_per_byte
         hamming_blocks_needed = (total_data_bits + 3) // 4
         rep_length = hamming_blocks_needed * 7
-        num_segments = len(audio) // segment_length
+        num_segments = audio_len // segment_length
         redundancy = num_segments // rep_length
 
         if redundancy < 1:
             bits_needed = watermark_message_length * 8
-            segment_length = self._auto_segment_length(len(audio), bits_needed)
-            num_segments = len(audio) // segment_length
+            segment_length = self._auto_segment_length(audio_len, bits_needed)
+            num_segments = audio_len // segment_length
             if num_segments < bits_needed:
                 raise ValueError("Le signal est trop court pour extraire le watermark.")
-            np.random.seed(seed)
-            segment_indices = np.random.choice(np.arange(num_segments), size=bits_needed, replace=False)
-            band_lower = int(segment_length * self.band_lower_pct / 100)
-            band_upper = int(segment_length * self.band_upper_pct / 100)
-            bits = []
-            for bit_idx, seg_idx in enumerate(segment_indices):
-                start = seg_idx * segment_length
-                end = start + segment_length
-                segment = audio[start:end]
-                segment = np.array(segment, dtype=np.float64)
-                coeffs = dct(segment, norm='ortho')
-                coeff_indices = self.get_coeff_indices(band_lower, band_upper, n_coeffs, bit_idx + seed)
-                votes = [1 if coeffs[idx] >= 0 else -1 for idx in coeff_indices]
-                bits.append(1 if np.sum(votes) >= 0 else 0)
-            bytes_array = []
-            for i in range(0, len(bits), 8):
-                byte_bits = bits[i:i+8]
-                if len(byte_bits) < 8:
-                    break
-                byte_val = 0
-                for bit in byte_bits:
-                    byte_val = (byte_val << 1) | bit
-                bytes_array.append(byte_val)
-            watermark_bytes = bytes(bytes_array)
-            try:
-                watermark_str = watermark_bytes.decode('utf-8', errors='replace')
-            except UnicodeDecodeError:
-                watermark_str = "Erreur de décodage (UTF-8, court)"
-            return watermark_str
-        else:
-            total_bits = redundancy * rep_length
-            np.random.seed(seed)
-            segment_indices = np.random.choice(np.arange(num_segments), size=total_bits, replace=False)
-            band_lower = int(segment_length * self.band_lower_pct / 100)
-            band_upper = int(segment_length * self.band_upper_pct / 100)
-            extracted_bits = []
-            for bit_idx, seg_idx in enumerate(segment_indices):
-                start = seg_idx * segment_length
-                end = start + segment_length
-                segment = audio[start:end]
-                segment = np.array(segment, dtype=np.float64)
-                coeffs = dct(segment, norm='ortho')
-                coeff_indices = self.get_coeff_indices(band_lower, band_upper, n_coeffs, bit_idx + seed)
-                votes = [1 if coeffs[idx] >= 0 else -1 for idx in coeff_indices]
-                extracted_bits.append(1 if np.sum(votes) >= 0 else 0)
-            arr = np.array(extracted_bits).reshape((redundancy, rep_length))
-            final_bits = []
-            for col in range(rep_length):
-                final_bits.append(1 if np.sum(arr[:, col]) >= (redundancy / 2.0) else 0)
-            decoded_bits = self.hamming_decode_bitstring(final_bits)
-            decoded_bits = decoded_bits[:total_data_bits]
-            bytes_array = []
-            for i in range(0, len(decoded_bits), 8):
-                byte_bits = decoded_bits[i:i+8]
-                if len(byte_bits) < 8: break
-                byte_val = 0
-                for bit in byte_bits:
-                    byte_val = (byte_val << 1) | bit
-                bytes_array.append(byte_val)
-            watermark_bytes = bytes(bytes_array)
-            if len(watermark_bytes) < 4:
-                raise ValueError("Watermark décodé trop court.")
-            message = watermark_bytes[:-4]
-            crc_extracted = watermark_bytes[-4:]
-            crc_calculated = zlib.crc32(message).to_bytes(4, 'big')
+            return segment_length, 0, bits_needed, total_data_bits
+        return segment_length, redundancy, rep_length, total_data_bits
+
+    def _decode_bits(self, extracted_bits, redundancy, rep_length, total_data_bits):
+        if redundancy == 0:
+            return self._decode_short_payload(extracted_bits)
+        final_bits = self._majority_bits(extracted_bits, redundancy, rep_length)
+        return self._decode_crc_payload(final_bits, total_data_bits)
+
+    def _decode_llr(self, llr, redundancy, rep_length, total_data_bits):
+        """Décision souple : LLR sommés sur les copies, puis Hamming à entrée souple (watermark court :
+        signe des LLR). La confiance d'un bit du message est tanh(|LLR| / 2), soit 1 - 2 P(erreur).
+        Retourne {extracted_watermark, crc_valid (None pour le watermark court), bit_confidence}."""
+        combined = np.asarray(llr).reshape(max(redundancy, 1), rep_length).sum(axis=0)
+        if redundancy == 0:
+            bits = (combined >= 0).astype(np.uint8)
+            return {
+                "extracted_watermark": self._decode_short_payload(bits), "crc_valid": None,
+                "bit_confidence": np.tanh(np.abs(combined) / 2).tolist()
+            }
+        data_bits, data_llr = self.codec.decode_soft(combined)
+        watermark_str, crc_valid = self._check_crc_message(data_bits[:total_data_bits])
+        self._report_crc(crc_valid)
+        # Confiances des bits du message seul, sans les 32 bits du CRC
+        return {
+            "extracted_watermark": watermark_str, "crc_valid": crc_valid,
+            "bit_confidence": np.tanh(np.abs(data_llr[:total_data_bits - 32]) / 2).tolist()
+        }
+
+    def extract_watermark_soft(self, audio, watermark_message_length, segment_length=None, seed=None, modulation_strength=None, method=None, dwt_level=None, dwt_wavelet=None, dwt_coeff_type=None):
+        """Extraction à décision souple (DCT ou DWT-DCT) : les corrélations brutes sont gardées sous forme
+        de LLR, cumulées sur les copies redondantes et décodées par Hamming à entrée souple, au lieu des
+        votes ±1 et de la majorité. Retourne le dict de _decode_llr, avec une confiance par bit."""
+        segment_length = segment_length or self.params.segment_length
+        seed = seed or self.params.seed
+        modulation_strength = modulation_strength or self.params.modulation_strength
+        method = method or self.params.method
+        dwt_level = dwt_level if dwt_level is not None else self.params.dwt_level
+        dwt_wavelet = dwt_wavelet if dwt_wavelet is not None else self.params.dwt_wavelet
+        dwt_coeff_type = dwt_coeff_type if dwt_coeff_type is not None else self.params.dwt_coeff_type
+
+        segment_length, redundancy, rep_length, total_data_bits = self._extract_plan(len(audio), watermark_message_length, segment_length)
+        schedule = self._method_schedule(method, seed, len(audio), segment_length, max(redundancy, 1) * rep_length, dwt_level, dwt_wavelet)
+        llr = self._extract_llr(method, audio, segment_length, schedule, modulation_strength, dwt_level, dwt_wavelet, dwt_coeff_type)
+        return self._decode_llr(llr, redundancy, rep_length, total_data_bits)
+
+    def extract_watermark(self, audio, watermark_message_length, segment_length=None, seed=None, modulation_strength=None):
+        if self.params.decision == "soft":
+            return self.extract_watermark_soft(audio, watermark_message_length, segment_length, seed, modulation_strength, "DCT")["extracted_watermark"]
+        segment_length = segment_length or self.params.segment_length
+        seed = seed or self.params.seed
+
+        segment_length, redundancy, rep_length, total_data_bits = self._extract_plan(len(audio), watermark_message_length, segment_length)
+        schedule = self._method_schedule("DCT", seed, len(audio), segment_length, max(redundancy, 1) * rep_length)
+        extracted_bits = self._extract_bits_dct(audio, segment_length, schedule)
+        return self._decode_bits(extracted_bits, redundancy, rep_length, total_data_bits)
+
+    # -------------- Synchronisation (décalage d'origine) --------------
+    def _dwt_detection_rows(self, segment_length, dwt_level, dwt_wavelet, dwt_coeff_type, band_lower=0, band_upper=None):
+        """Lignes band_lower..band_upper-1 de la matrice de la chaîne wavedec -> sous-bande -> DCT :
+        le coefficient k d'un segment vaut <segment, ligne k - band_lower>. Obtenues en appliquant la
+        chaîne, linéaire, à l'identité par blocs de lignes."""
+        if band_upper is None:
+            band_upper = self._dwt_subband_length(segment_length, dwt_level, dwt_wavelet)
+        rows = np.empty((band_upper - band_lower, segment_length))
+        for first in range(0, segment_length, self.batch_segments):
+            count = min(self.batch_segments, segment_length - first)
+            identity = np.zeros((count, segment_length))
+            identity[np.arange(count), first + np.arange(count)] = 1.0
+            _, _, c_mod = self._dwt_dct_coeffs(identity, dwt_level, dwt_wavelet, dwt_coeff_type)
+            rows[:, first:first + count] = c_mod[:, band_lower:band_upper].T
+        return rows
+
+    def _detection_patterns(self, coeff_indices, segment_length, basis=None):
+        """Motifs temporels p_i tels que <segment, p_i> = somme des coefficients lus pour le bit i.
+
+        basis : (indice de la première ligne, lignes de détection) — lignes de DCT de la bande en cache,
+        ou lignes de la chaîne DWT-DCT ; sans table, IDCT de l'indicatrice des coefficients.
+        """
+        coeff_indices = np.asarray(coeff_indices, dtype=np.intp)
+        if basis is not None and basis[1] is not None:
+            first_row, rows = basis
+            return rows[coeff_indices - first_row].sum(axis=1)
+        indicator = np.zeros((len(coeff_indices), segment_length))
+        np.put_along_axis(indicator, coeff_indices, 1.0, axis=1)
+        return sp_fft.idct(indicator, norm='ortho', axis=-1, workers=self.transform_workers)
+
+    def _sync_scores(self, audio, segment_length, schedule, rep_length, first_offset, last_offset, basis=None):
+        """Score de chaque décalage de [first_offset, last_offset] pour une table de clé donnée.
+
+        Une FFT par bit sur une fenêtre de segment_length + (last_offset - first_offset) échantillons
+        donne la corrélation <segment décalé, motif> pour tous les décalages ; les corrélations d'un même
+        bit du message sont sommées sur les copies (le signe est commun), puis score = somme des |.|.
+        """
+        span = last_offset - first_offset
+        window = segment_length + span
+        nfft = sp_fft.next_fast_len(window, real=True)
+        # Zéros avant et après le signal pour les fenêtres qui en débordent
+        starts = schedule.segment_indices.astype(np.int64) * segment_length + first_offset
+        lead = max(0, -int(starts.min())) if len(starts) else 0
+        tail = max(0, int(starts.max()) + window - len(audio)) if len(starts) else 0
+        padded = np.concatenate([
+            np.zeros(lead, dtype=np.float32), np.asarray(audio, dtype=np.float32), np.zeros(tail, dtype=np.float32)
+        ])
+        combined = np.zeros((rep_length, span + 1))
+        # Lots multiples de rep_length : la copie i du bit b est la ligne b de chaque bloc
+        batch = max(1, self.batch_segments * segment_length // (4 * nfft * rep_length)) * rep_length
+        window_range = np.arange(window)
+        for first in range(0, len(schedule), batch):
+            last = first + batch
+            windows = padded[starts[first:last, None] + lead + window_range].astype(np.float64)
+            patterns = self._detection_patterns(schedule.coeff_indices[first:last], segment_length, basis)
+            spectrum = sp_fft.rfft(windows, nfft, axis=-1, workers=self.transform_workers)
+            spectrum *= np.conj(sp_fft.rfft(patterns, nfft, axis=-1, workers=self.transform_workers))
+            correlation = sp_fft.irfft(spectrum, nfft, axis=-1, workers=self.transform_workers)[:, :span + 1]
+            full = len(correlation) - len(correlation) % rep_length
+            combined += correlation[:full].reshape(-1, rep_length, span + 1).sum(axis=0)
+            combined[:len(correlation) - full] += correlation[full:]
+        return np.abs(combined).sum(axis=0)
+
+    def find_offset(self, audio, watermark_message_length, segment_length=None, seed=None, method=None, dwt_level=None, dwt_wavelet=None, dwt_coeff_type=None, max_offset=None):
+        """Décalage du début du watermark dans `audio`, cherché dans [-max_offset, max_offset].
+
+        Un décalage o > 0 signifie o échantillons en trop au début (silence ajouté), o < 0 des
+        échantillons manquants (fichier rogné). La longueur alignée fixe le nombre de segments, donc
+        la table de clé : chaque découpage possible sur la plage est évalué avec sa table, et le
+        décalage retenu est celui du meilleur rapport pic / médiane des scores.
+        Retourne (décalage, rapport pic / médiane). Par défaut max_offset = segment_length.
+        """
+        segment_length = segment_length or self.params.segment_length
+        seed = seed or self.params.seed
+        method = method or self.params.method
+        dwt_level = dwt_level if dwt_level is not None else self.params.dwt_level
+        dwt_wavelet = dwt_wavelet if dwt_wavelet is not None else self.params.dwt_wavelet
+        dwt_coeff_type = dwt_coeff_type if dwt_coeff_type is not None else self.params.dwt_coeff_type
+        max_offset = segment_length if max_offset is None else int(max_offset)
+
+        # Décalages regroupés par découpage (longueur de segment effective, redondance, nombre de segments)
+        layouts = {}
+        for offset in range(-max_offset, max_offset + 1):
             try:
-                watermark_str = message.decode('utf-8')
-            except UnicodeDecodeError:
-                watermark_str = "Erreur de décodage (UTF-8)"
-            if crc_extracted != crc_calculated:
-                print("Attention : CRC non vérifié, le watermark extrait peut être incorrect.")
+                plan = self._extract_plan(len(audio) - offset, watermark_message_length, segment_length)
+            except ValueError:
+                continue
+            layouts.setdefault(plan + ((len(audio) - offset) // plan[0],), []).append(offset)
+        if not layouts:
+            raise ValueError("Le signal est trop court pour extraire le watermark.")
+
+        best_offset, best_ratio = 0, 0.0
+        for (layout_length, redundancy, rep_length, _, num_segments), offsets in layouts.items():
+            schedule = self._method_schedule(
+                method, seed, num_segments * layout_length, layout_length, max(redundancy, 1) * rep_length, dwt_level, dwt_wavelet
+            )
+            if method == "DCT":
+                basis = self._dct_basis(layout_length)
             else:
-                print("CRC vérifié avec succès.")
-            return watermark_str
+                basis = self._dwt_basis(layout_length, dwt_level, dwt_wavelet, dwt_coeff_type, "detect")
+                if basis[1] is None:
+                    basis = (0, self._dwt_detection_rows(layout_length, dwt_level, dwt_wavelet, dwt_coeff_type))
+            # Chaque plage contiguë de décalages du découpage est corrélée seule, avec une marge d'un quart
+            # de segment de part et d'autre comme référence de bruit (médiane) : coût linéaire en max_offset
+            offsets = np.asarray(offsets)
+            margin = layout_length // 4
+            for run in np.split(offsets, np.flatnonzero(np.diff(offsets) != 1) + 1):
+                first_offset = int(run[0]) - margin
+                scores = self._sync_scores(audio, layout_length, schedule, rep_length, first_offset, int(run[-1]) + margin, basis)
+                run_scores = scores[run - first_offset]
+                peak = int(np.argmax(run_scores))
+                ratio = float(run_scores[peak] / max(np.median(scores), np.finfo(np.float64).tiny))
+                if ratio > best_ratio:
+                    best_offset, best_ratio = int(run[peak]), ratio
+        return best_offset, best_ratio
 
-    def embed_watermark_dwt_dct(self, audio, watermark, segment_length=None, seed=None, modulation_strength=None, dwt_level=None, dwt_wavelet=None, dwt_coeff_type=None):
-        segment_length = segment_length or self.segment_length
-        seed = seed or self.seed
-        modulation_strength = modulation_strength or self.modulation_strength
-        n_coeffs = self.n_coeffs
-        dwt_level = dwt_level if dwt_level is not None else self.dwt_level
-        dwt_wavelet = dwt_wavelet if dwt_wavelet is not None else self.dwt_wavelet
-        dwt_coeff_type = dwt_coeff_type if dwt_coeff_type is not None else self.dwt_coeff_type
+    @staticmethod
+    def align_audio(audio, offset):
+        # Ramène le début du watermark à l'échantillon 0 : coupe le surplus ou complète par des zéros
+        if offset >= 0:
+            return audio[offset:]
+        return np.concatenate([np.zeros(-offset, dtype=audio.dtype), audio])
 
-        watermark_bytes = watermark.encode('utf-8')
-        crc = zlib.crc32(watermark_bytes).to_bytes(4, 'big')
-        watermark_with_crc = watermark_bytes + crc
-        wm_bits = []
-        for byte in watermark_with_crc:
-            for i in range(7, -1, -1):
-                wm_bits.append(1 if (byte >> i) & 1 else 0)
-        encoded_bits = self.hamming_encode_bitstring(wm_bits)
-        rep_length = len(encoded_bits)
-        num_segments = len(audio) // segment_length
-        redundancy = num_segments // rep_length
+    # -------------- Détection multi-candidats --------------
+    def detect_watermark(self, audio, candidates):
+        """Évalue plusieurs jeux de paramètres candidats sur un même signal décodé.
 
-        if redundancy < 1:
-            wm_bits = []
-            for byte in watermark_bytes:
-                for i in range(7, -1, -1):
-                    wm_bits.append(1 if (byte >> i) & 1 else 0)
-            bits_needed = len(wm_bits)
-            segment_length = self._auto_segment_length(len(audio), bits_needed)
-            num_segments = len(audio) // segment_length
-            if num_segments < bits_needed:
-                raise ValueError("Le signal est trop court pour contenir le watermark, même sans correction d'erreur.")
-            np.random.seed(seed)
-            segment_indices = np.random.choice(np.arange(num_segments), size=bits_needed, replace=False)
-            audio_watermarked = np.copy(audio)
-            for bit_idx, (seg_idx, bit) in enumerate(zip(segment_indices, wm_bits)):
-                start = seg_idx * segment_length
-                end = start + segment_length
-                segment = audio[start:end]
-                segment = np.array(segment, dtype=np.float64)
-                coeffs = pywt.wavedec(segment, dwt_wavelet, level=dwt_level)
-                if dwt_coeff_type == 'cA':
-                    c = coeffs[0]
-                else:
-                    c = coeffs[1]
-                idx_low = int(len(c) * self.band_lower_pct / 100)
-                idx_up = int(len(c) * self.band_upper_pct / 100)
-                coeff_indices = self.get_coeff_indices(idx_low, idx_up, n_coeffs, bit_idx + seed + 123)
-                c_mod = dct(c, norm='ortho')
-                for idx in coeff_indices:
-                    c_mod[idx] += modulation_strength * (1 if bit == 1 else -1)
-                c = idct(c_mod, norm='ortho')
-                if dwt_coeff_type == 'cA':
-                    coeffs[0] = c
+        candidates : liste de (WatermarkParams, longueur du message). Les candidats qui partagent un
+        découpage (longueur de segment effective et bande, plus ondelette/niveau/sous-bande en DWT-DCT)
+        partagent les transformées, calculées une seule fois sur l'union de leurs segments. Renvoie un
+        dict par candidat, classés par CRC valide puis marge de vote décroissante ; un candidat inapplicable
+        (paramètres invalides, signal trop court, bande trop étroite) porte une clé "error" et finit en
+        queue, sans interrompre l'évaluation des autres.
+        """
+        results = []
+        groups = {}
+        for params, watermark_length in candidates:
+            result = {"params": asdict(params), "watermark_length": watermark_length}
+            results.append(result)
+            error = self._candidate_error(params, watermark_length)
+            if error is not None:
+                result["error"] = error
+                continue
+            engine = AudioWatermarker(params)
+            try:
+                segment_length, redundancy, rep_length, total_data_bits = engine._extract_plan(len(audio), watermark_length, params.segment_length)
+                schedule = engine._method_schedule(
+                    params.method, params.seed, len(audio), segment_length, max(redundancy, 1) * rep_length,
+                    params.dwt_level, params.dwt_wavelet
+                )
+                if params.method == "DCT":
+                    key = (segment_length, engine._band_bounds(segment_length))
                 else:
-                    coeffs[1] = c
-                segment_mod = pywt.waverec(coeffs, dwt_wavelet)
-                segment_mod = segment_mod[:segment_length]
-                audio_watermarked[start:end] = segment_mod.astype(np.float32)
-            return audio_watermarked
+                    subband_length = engine._dwt_subband_length(segment_length, params.dwt_level, params.dwt_wavelet)
+                    key = (segment_length, engine._band_bounds(subband_length), params.dwt_level, params.dwt_wavelet, params.dwt_coeff_type)
+            except Exception as e:
+                result["error"] = str(e)
+                continue
+            groups.setdefault(key, []).append((result, engine, schedule, redundancy, rep_length, total_data_bits))
+
+        for done, (key, members) in enumerate(groups.items()):
+            try:
+                votes = self._group_votes(audio, members[0][1], key[0], [member[2] for member in members])
+            except Exception as e:
+                for member in members:
+                    member[0]["error"] = str(e)
+                continue
+            for (result, engine, _, redundancy, rep_length, total_data_bits), member_votes in zip(members, votes):
+                try:
+                    result.update(engine._decode_votes(member_votes, redundancy, rep_length, total_data_bits))
+                except Exception as e:
+                    result["error"] = str(e)
+            self._report_progress(60 + 40 * (done + 1) / len(groups))
+
+        return sorted(
+            results,
+            key=lambda result: ("error" not in result, result.get("crc_valid") is True, result.get("margin", 0.0)),
+            reverse=True
+        )
+
+    @staticmethod
+    def _candidate_error(params, watermark_length):
+        # Paramètres inutilisables d'un candidat (message d'erreur), ou None
+        if params.method not in ("DCT", "DWT-DCT"):
+            return "Méthode invalide (valeurs possibles : DCT, DWT-DCT)"
+        if params.segment_length < 1 or params.n_coeffs < 1 or watermark_length < 1:
+            return "segment_length, n_coeffs et watermark_length doivent être strictement positifs"
+        if not 0 <= params.band_lower_pct < params.band_upper_pct <= 100:
+            return "Bande invalide : 0 <= band_lower_pct < band_upper_pct <= 100 attendu"
+        if params.method == "DWT-DCT":
+            if params.dwt_wavelet not in pywt.wavelist(kind='discrete'):
+                return f"Ondelette inconnue : {params.dwt_wavelet}"
+            if params.dwt_level < 1:
+                return "dwt_level doit être strictement positif"
+            if params.dwt_coeff_type not in ("cA", "cD"):
+                return "Type de coefficients invalide (valeurs possibles : cA, cD)"
+        return None
+
+    def _group_votes(self, audio, engine, segment_length, schedules):
+        """Votes signés (somme des ±1 par bit) de plusieurs tables de clé partageant un découpage.
+
+        engine : moteur d'un candidat du groupe, dont les paramètres (méthode, bande, ondelette) sont
+        communs à tous. Chaque candidat projette ses segments sur ses seules lignes de détection ; sans
+        table en cache, chaque segment de l'union n'est transformé qu'une fois, par lots.
+        """
+        params = engine.params
+        dwt_config = (params.dwt_level, params.dwt_wavelet, params.dwt_coeff_type)
+        frames = self._segment_frames(audio, segment_length)
+        if params.method == "DCT":
+            basis = engine._dct_basis(segment_length)
         else:
-            watermark_bits_full = encoded_bits * redundancy
-            watermark_mod = [1 if bit == 1 else -1 for bit in watermark_bits_full]
-            np.random.seed(seed)
-            segment_indices = np.random.choice(np.arange(num_segments), size=len(watermark_mod), replace=False)
-            audio_watermarked = np.copy(audio)
-            for bit_idx, (seg_idx, bit) in enumerate(zip(segment_indices, watermark_mod)):
-                start = seg_idx * segment_length
-                end = start + segment_length
-                segment = audio[start:end]
-                segment = np.array(segment, dtype=np.float64)
-                coeffs = pywt.wavedec(segment, dwt_wavelet, level=dwt_level)
-                if dwt_coeff_type == 'cA':
-                    c = coeffs[0]
-                else:
-                    c = coeffs[1]
-                idx_low = int(len(c) * self.band_lower_pct / 100)
-                idx_up = int(len(c) * self.band_upper_pct / 100)
-                coeff_indices = self.get_coeff_indices(idx_low, idx_up, n_coeffs, bit_idx + seed + 123)
-                c_mod = dct(c, norm='ortho')
-                for idx in coeff_indices:
-                    c_mod[idx] += modulation_strength * bit
-                c = idct(c_mod, norm='ortho')
-                if dwt_coeff_type == 'cA':
-                    coeffs[0] = c
+            basis = engine._dwt_basis(segment_length, *dwt_config, "detect")
+        union = np.unique(np.concatenate([schedule.segment_indices for schedule in schedules]))
+        members = []
+        for schedule in schedules:
+            positions = np.searchsorted(union, schedule.segment_indices)
+            order = np.argsort(positions, kind='stable')
+            members.append((schedule, order, positions[order], np.empty(len(schedule), dtype=np.int32)))
+        for first in range(0, len(union), self.batch_segments):
+            last = first + self.batch_segments
+            segments = frames[union[first:last]]
+            if basis[1] is None and params.method == "DCT":
+                coeffs = sp_fft.dct(segments.astype(np.float64), norm='ortho', axis=-1, workers=self.transform_workers)
+            elif basis[1] is None:
+                _, _, coeffs = self._dwt_dct_coeffs(segments.astype(np.float64), *dwt_config)
+            for schedule, order, sorted_positions, votes in members:
+                lo, hi = np.searchsorted(sorted_positions, [first, last])
+                bits = order[lo:hi]
+                rows = sorted_positions[lo:hi] - first
+                if basis[1] is None:
+                    selected = coeffs[rows[:, None], schedule.coeff_indices[bits]]
                 else:
-                    coeffs[1] = c
-                segment_mod = pywt.waverec(coeffs, dwt_wavelet)
-                segment_mod = segment_mod[:segment_length]
-                audio_watermarked[start:end] = segment_mod.astype(np.float32)
-            return audio_watermarked
+                    selected = self._project_coeffs(segments[rows], schedule.coeff_indices[bits], basis)
+                votes[bits] = np.where(selected >= 0, 1, -1).sum(axis=1)
+        return [member[3] for member in members]
+
+    def _decode_votes(self, votes, redundancy, rep_length, total_data_bits):
+        """Décodage d'un candidat à partir de ses votes signés, avec les mêmes décisions que l'extraction.
+
+        La marge est la moyenne, sur les bits du message, de |somme des votes de toutes les copies|
+        rapportée à son maximum (n_coeffs x copies) : proche de 1 pour un watermark net, de 0 sinon.
+        """
+        bits = (votes >= 0).astype(np.uint8)
+        copies = votes.reshape(max(redundancy, 1), rep_length)
+        margin = float(np.abs(copies.sum(axis=0)).mean()) / (self.params.n_coeffs * max(redundancy, 1))
+        if redundancy == 0:
+            return {"extracted_watermark": self._decode_short_payload(bits), "crc_valid": None, "margin": margin}
+        final_bits = self._majority_bits(bits, redundancy, rep_length)
+        watermark_str, crc_valid = self._check_crc_payload(final_bits, total_data_bits)
+        return {"extracted_watermark": watermark_str, "crc_valid": bool(crc_valid), "margin": margin}
+
+    def embed_watermark_dwt_dct(self, audio, watermark, segment_length=None, seed=None, modulation_strength=None, dwt_level=None, dwt_wavelet=None, dwt_coeff_type=None):
+        segment_length = segment_length or self.params.segment_length
+        seed = seed or self.params.seed
+        modulation_strength = modulation_strength or self.params.modulation_strength
+        dwt_level = dwt_level if dwt_level is not None else self.params.dwt_level
+        dwt_wavelet = dwt_wavelet if dwt_wavelet is not None else self.params.dwt_wavelet
+        dwt_coeff_type = dwt_coeff_type if dwt_coeff_type is not None else self.params.dwt_coeff_type
+
+        segment_length, signs = self._embed_plan(len(audio), watermark, segment_length)
+        schedule = self._method_schedule("DWT-DCT", seed, len(audio), segment_length, len(signs), dwt_level, dwt_wavelet)
+        return self._embed_segments_dwt_dct(audio, segment_length, schedule, signs, modulation_strength, dwt_level, dwt_wavelet, dwt_coeff_type)
+
+    def watermark_delta(self, audio_len, watermark, segment_length=None, seed=None, method="DCT", dwt_level=None, dwt_wavelet=None, dwt_coeff_type=None):
+        """Motif du watermark à force unité, par segment porteur.
+
+        DCT et DWT-DCT (ondelette fixée) sont linéaires : le signal marqué à la force s vaut
+        audio + s * delta, à l'arrondi float32 près. Voir apply_watermark_delta.
+        """
+        segment_length = segment_length or self.params.segment_length
+        seed = seed or self.params.seed
+        dwt_level = dwt_level if dwt_level is not None else self.params.dwt_level
+        dwt_wavelet = dwt_wavelet if dwt_wavelet is not None else self.params.dwt_wavelet
+        dwt_coeff_type = dwt_coeff_type if dwt_coeff_type is not None else self.params.dwt_coeff_type
+
+        segment_length, signs = self._embed_plan(audio_len, watermark, segment_length)
+        schedule = self._method_schedule(method, seed, audio_len, segment_length, len(signs), dwt_level, dwt_wavelet)
+        rows = self._delta_rows(schedule.coeff_indices, signs, segment_length, method, dwt_level, dwt_wavelet, dwt_coeff_type)
+        return WatermarkDelta(segment_length, schedule.segment_indices, rows)
+
+    def _delta_rows(self, coeff_indices, signs, segment_length, method, dwt_level, dwt_wavelet, dwt_coeff_type):
+        # Une ligne temporelle par bit : IDCT du motif ±1 (puis waverec pour DWT-DCT)
+        signs = np.asarray(signs, dtype=np.float64)
+        rows = np.empty((len(coeff_indices), segment_length), dtype=np.float32)
+        basis = self._embed_basis(segment_length, method, dwt_level, dwt_wavelet, dwt_coeff_type)
+        if basis is not None:
+            for first in range(0, len(coeff_indices), BASIS_BATCH_SEGMENTS):
+                last = first + BASIS_BATCH_SEGMENTS
+                rows[first:last] = self._basis_patterns(coeff_indices[first:last], signs[first:last], basis)
+            return rows
+        band_length = segment_length if method == "DCT" else self._dwt_subband_length(segment_length, dwt_level, dwt_wavelet)
+        for first in range(0, len(coeff_indices), self.batch_segments):
+            last = min(first + self.batch_segments, len(coeff_indices))
+            unit = np.zeros((last - first, band_length))
+            np.put_along_axis(unit, coeff_indices[first:last], signs[first:last, None], axis=1)
+            pattern = sp_fft.idct(unit, norm='ortho', axis=-1, workers=self.transform_workers)
+            if method != "DCT":
+                coeffs = pywt.wavedec(np.zeros((last - first, segment_length)), dwt_wavelet, level=dwt_level, axis=-1)
+                coeffs[0 if dwt_coeff_type == 'cA' else 1] = pattern
+                pattern = pywt.waverec(coeffs, dwt_wavelet, axis=-1)[:, :segment_length]
+            rows[first:last] = pattern
+        return rows
+
+    def apply_watermark_delta(self, audio, delta, modulation_strength):
+        # audio + s * delta, segment par segment, sans aucune transformée
+        audio_watermarked = np.copy(audio)
+        frames = self._segment_frames(audio_watermarked, delta.segment_length)
+        for first in range(0, len(delta.segment_indices), self.batch_segments):
+            last = first + self.batch_segments
+            batch = delta.segment_indices[first:last]
+            frames[batch] += np.float32(modulation_strength) * delta.rows[first:last]
+        return audio_watermarked
 
     def extract_watermark_dwt_dct(self, audio, watermark_message_length, segment_length=None, seed=None, modulation_strength=None, dwt_level=None, dwt_wavelet=None, dwt_coeff_type=None):
-        segment_length = segment_length or self.segment_length
-        seed = seed or self.seed
-        n_coeffs = self.n_coeffs
-        dwt_level = dwt_level if dwt_level is not None else self.dwt_level
-        dwt_wavelet = dwt_wavelet if dwt_wavelet is not None else self.dwt_wavelet
-        dwt_coeff_type = dwt_coeff_type if dwt_coeff_type is not None else self.dwt_coeff_type
+        if self.params.decision == "soft":
+            return self.extract_watermark_soft(
+                audio, watermark_message_length, segment_length, seed, modulation_strength,
+                "DWT-DCT", dwt_level, dwt_wavelet, dwt_coeff_type
+            )["extracted_watermark"]
+        segment_length = segment_length or self.params.segment_length
+        seed = seed or self.params.seed
+        dwt_level = dwt_level if dwt_level is not None else self.params.dwt_level
+        dwt_wavelet = dwt_wavelet if dwt_wavelet is not None else self.params.dwt_wavelet
+        dwt_coeff_type = dwt_coeff_type if dwt_coeff_type is not None else self.params.dwt_coeff_type
 
-        message_bytes_length = watermark_message_length + 4
-        bits_per_byte = 8
-        total_data_bits = message_bytes_length * bits_per_byte
-        hamming_blocks_needed = (total_data_bits + 3) // 4
-        rep_length = hamming_blocks_needed * 7
-        num_segments = len(audio) // segment_length
-        redundancy = num_segments // rep_length
+        segment_length, redundancy, rep_length, total_data_bits = self._extract_plan(len(audio), watermark_message_length, segment_length)
+        schedule = self._method_schedule("DWT-DCT", seed, len(audio), segment_length, max(redundancy, 1) * rep_length, dwt_level, dwt_wavelet)
+        extracted_bits = self._extract_bits_dwt_dct(audio, segment_length, schedule, dwt_level, dwt_wavelet, dwt_coeff_type)
+        return self._decode_bits(extracted_bits, redundancy, rep_length, total_data_bits)
 
-        if redundancy < 1:
-            bits_needed = watermark_message_length * 8
-            segment_length = self._auto_segment_length(len(audio), bits_needed)
-            num_segments = len(audio) // segment_length
-            if num_segments < bits_needed:
-                raise ValueError("Le signal est trop court pour extraire le watermark.")
-            np.random.seed(seed)
-            segment_indices = np.random.choice(np.arange(num_segments), size=bits_needed, replace=False)
-            bits = []
-            for bit_idx, seg_idx in enumerate(segment_indices):
-                start = seg_idx * segment_length
-                end = start + segment_length
-                segment = audio[start:end]
-                segment = np.array(segment, dtype=np.float64)
-                coeffs = pywt.wavedec(segment, dwt_wavelet, level=dwt_level)
-                if dwt_coeff_type == 'cA':
-                    c = coeffs[0]
-                else:
-                    c = coeffs[1]
-                idx_low = int(len(c) * self.band_lower_pct / 100)
-                idx_up = int(len(c) * self.band_upper_pct / 100)
-                coeff_indices = self.get_coeff_indices(idx_low, idx_up, n_coeffs, bit_idx + seed + 123)
-                c_mod = dct(c, norm='ortho')
-                votes = [1 if c_mod[idx] >= 0 else -1 for idx in coeff_indices]
-                bits.append(1 if np.sum(votes) >= 0 else 0)
-            bytes_array = []
-            for i in range(0, len(bits), 8):
-                byte_bits = bits[i:i+8]
-                if len(byte_bits) < 8:
-                    break
-                byte_val = 0
-                for bit in byte_bits:
-                    byte_val = (byte_val << 1) | bit
-                bytes_array.append(byte_val)
-            watermark_bytes = bytes(bytes_array)
-            try:
-                watermark_str = watermark_bytes.decode('utf-8', errors='replace')
-            except UnicodeDecodeError:
-                watermark_str = "Erreur de décodage (UTF-8, court)"
-            return watermark_str
-        else:
-            total_bits = redundancy * rep_length
-            np.random.seed(seed)
-            segment_indices = np.random.choice(np.arange(num_segments), size=total_bits, replace=False)
-            extracted_bits = []
-            for bit_idx, seg_idx in enumerate(segment_indices):
-                start = seg_idx * segment_length
-                end = start + segment_length
-                segment = audio[start:end]
-                segment = np.array(segment, dtype=np.float64)
-                coeffs = pywt.wavedec(segment, dwt_wavelet, level=dwt_level)
-                if dwt_coeff_type == 'cA':
-                    c = coeffs[0]
-                else:
-                    c = coeffs[1]
-                idx_low = int(len(c) * self.band_lower_pct / 100)
-                idx_up = int(len(c) * self.band_upper_pct / 100)
-                coeff_indices = self.get_coeff_indices(idx_low, idx_up, n_coeffs, bit_idx + seed + 123)
-                c_mod = dct(c, norm='ortho')
-                votes = [1 if c_mod[idx] >= 0 else -1 for idx in coeff_indices]
-                extracted_bits.append(1 if np.sum(votes) >= 0 else 0)
-            arr = np.array(extracted_bits).reshape((redundancy, rep_length))
-            final_bits = []
-            for col in range(rep_length):
-                final_bits.append(1 if np.sum(arr[:, col]) >= (redundancy / 2.0) else 0)
-            decoded_bits = self.hamming_decode_bitstring(final_bits)
-            decoded_bits = decoded_bits[:total_data_bits]
-            bytes_array = []
-            for i in range(0, len(decoded_bits), 8):
-                byte_bits = decoded_bits[i:i+8]
-                if len(byte_bits) < 8: break
-                byte_val = 0
-                for bit in byte_bits:
-                    byte_val = (byte_val << 1) | bit
-                bytes_array.append(byte_val)
-            watermark_bytes = bytes(bytes_array)
-            if len(watermark_bytes) < 4:
-                raise ValueError("Watermark décodé trop court.")
-            message = watermark_bytes[:-4]
-            crc_extracted = watermark_bytes[-4:]
-            crc_calculated = zlib.crc32(message).to_bytes(4, 'big')
-            try:
-                watermark_str = message.decode('utf-8')
-            except UnicodeDecodeError:
-                watermark_str = "Erreur de décodage (UTF-8)"
-            if crc_extracted != crc_calculated:
-                print("Attention : CRC non vérifié, le watermark extrait peut être incorrect.")
-            else:
-                print("CRC vérifié avec succès.")
-            return watermark_str
+    def embed_watermark_with_test(self, audio, watermark, segment_length=None, seed=None, modulation_strength=None, fmt="wav", method="DCT", dwt_level=None, dwt_wavelet=None, dwt_coeff_type=None, search_mode="bisect", verify_lossless=True, keep_check_audio=False):
+        """Insère le watermark à la plus petite force qui survit à l'encodage dans `fmt`.
 
-    def embed_watermark_with_test(self, audio, watermark, segment_length=None, seed=None, modulation_strength=None, fmt="wav", method="DCT", dwt_level=None, dwt_wavelet=None, dwt_coeff_type=None):
-        segment_length = segment_length or self.segment_length
-        seed = seed or self.seed
-        current_modulation = modulation_strength if modulation_strength is not None else self.modulation_strength
+        search_mode : "bisect" (rampe exponentielle puis dichotomie, O(log n) allers-retours codec)
+        ou "linear" (balayage historique par pas de 0.005).
+        Les allers-retours codec se font en mémoire (codec_round_trip). Pour un format lossless,
+        verify_lossless=False insère directement à la force demandée, sans extraction de contrôle.
+        Retourne un EmbedResult portant les octets encodés de la tentative retenue (et, si
+        keep_check_audio, le signal relu qui a servi à la vérification).
+        """
+        segment_length = segment_length or self.params.segment_length
+        seed = seed or self.params.seed
+        current_modulation = modulation_strength if modulation_strength is not None else self.params.modulation_strength
         max_modulation = 0.5
         watermark_fixed = watermark.ljust(12)[:12]
         sample_rate = 44100
         if isinstance(audio, tuple) and len(audio) >= 2:
             audio, sample_rate = audio[:2]
-        embed_func = self.embed_watermark if method == "DCT" else self.embed_watermark_dwt_dct
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Mode de recherche inconnu : {search_mode}")
         extract_func = self.extract_watermark if method == "DCT" else self.extract_watermark_dwt_dct
+        # Le motif à force unité est calculé une seule fois : chaque tentative n'est plus qu'un audio + s * delta
+        delta = self.watermark_delta(len(audio), watermark_fixed, segment_length, seed, method, dwt_level, dwt_wavelet, dwt_coeff_type)
+        self._report_progress(10)
 
-        while current_modulation <= max_modulation:
-            print(f"Tentative avec modulation_strength = {current_modulation}")
-            watermarked_audio = embed_func(
-                audio, watermark_fixed, segment_length, seed, current_modulation,
-                dwt_level, dwt_wavelet, dwt_coeff_type
-            ) if method != "DCT" else embed_func(
-                audio, watermark_fixed, segment_length, seed, current_modulation
-            )
-            audio_bytes = self.numpy_to_audio_bytes(watermarked_audio, sample_rate, fmt)
-            test_audio, _ = self.audio_bytes_to_numpy(audio_bytes, fmt)
+        def attempt(strength):
+            print(f"Tentative avec modulation_strength = {strength}")
+            watermarked_audio = self.apply_watermark_delta(audio, delta, strength)
+            audio_bytes, test_audio = self.codec_round_trip(watermarked_audio, sample_rate, fmt)
+            result = EmbedResult(watermarked_audio, strength, 0, audio_bytes, test_audio if keep_check_audio else None)
+            if is_lossless(fmt) and not verify_lossless:
+                return result
             try:
                 extracted = extract_func(
-                    test_audio, len(watermark_fixed), segment_length, seed, current_modulation,
+                    test_audio, len(watermark_fixed), segment_length, seed, strength,
                     dwt_level, dwt_wavelet, dwt_coeff_type
                 ) if method != "DCT" else extract_func(
-                    test_audio, len(watermark_fixed), segment_length, seed, current_modulation
+                    test_audio, len(watermark_fixed), segment_length, seed, strength
                 )
             except Exception as e:
                 extracted = ""
             if extracted.strip() == watermark_fixed.strip():
-                print(f"Watermark inséré avec succès avec modulation_strength = {current_modulation}")
-                return watermarked_audio, current_modulation
+                return result
+            print(f"Échec avec modulation_strength = {strength}")
+            return None
+
+        result, final_modulation, iterations = self._search_modulation(
+            attempt, current_modulation, max_modulation, search_mode
+        )
+        if result is None:
+            raise ValueError("Impossible d'insérer correctement le watermark dans les limites de modulation.")
+        print(f"Watermark inséré avec succès avec modulation_strength = {final_modulation} ({iterations} tentative(s))")
+        result.modulation = final_modulation
+        result.iterations = iterations
+        return result
+
+    def _search_modulation(self, attempt, start, max_modulation, search_mode, step=MODULATION_STEP):
+        """Cherche la plus petite force de la grille start + k * step (<= max_modulation) acceptée par `attempt`.
+
+        `attempt(force)` renvoie un résultat non nul en cas de succès. Le mode "bisect" suppose que
+        le succès est monotone en la force : rampe exponentielle sur k (0, 1, 3, 7, ...) jusqu'au premier
+        succès, puis dichotomie entre le dernier échec et ce succès.
+        Retourne (résultat, force, nombre_de_tentatives) ; résultat vaut None si aucune force ne convient.
+        La progression est rapportée de 10 à 95 % contre le nombre maximal de tentatives du mode.
+        """
+        iterations = 0
+        max_k = int(np.floor((max_modulation - start) / step + 1e-9)) if start <= max_modulation else 0
+        max_attempts = max_k + 1 if search_mode == "linear" else 2 * int(np.ceil(np.log2(max_k + 2)))
+
+        def report():
+            self._report_progress(10 + 85 * min(1.0, iterations / max_attempts))
+
+        if search_mode == "linear":
+            current_modulation = start
+            while current_modulation <= max_modulation:
+                iterations += 1
+                result = attempt(current_modulation)
+                report()
+                if result is not None:
+                    return result, current_modulation, iterations
+                current_modulation += step
+            return None, None, iterations
+
+        if start > max_modulation:
+            return None, None, iterations
+        failed_k = -1
+        passed_k, best = None, None
+        k, stride = 0, 1
+        while passed_k is None and failed_k < max_k:
+            iterations += 1
+            result = attempt(start + k * step)
+            report()
+            if result is not None:
+                passed_k, best = k, result
+            else:
+                failed_k = k
+                k = min(k + stride, max_k)
+                stride *= 2
+        if passed_k is None:
+            return None, None, iterations
+        while passed_k - failed_k > 1:
+            mid = (failed_k + passed_k) // 2
+            iterations += 1
+            result = attempt(start + mid * step)
+            report()
+            if result is not None:
+                passed_k, best = mid, result
             else:
-                print(f"Échec avec modulation_strength = {current_modulation}, augmentation de 0.005")
-                current_modulation += 0.005
-        raise ValueError("Impossible d'insérer correctement le watermark dans les limites de modulation.")
+                failed_k = mid
+        return best, start + passed_k * step, iterations
+
+    # -------------- Mode streaming (mémoire bornée) --------------
+    @staticmethod
+    def _downmix_pcm(pcm):
+        # Même arrondi que pydub set_channels(1) : floor((G + D) / 2) en stéréo, somme des x // n au-delà
+        channels = pcm.shape[1]
+        if channels == 1:
+            return pcm[:, 0]
+        if channels == 2:
+            return ((pcm[:, 0].astype(np.int64) + pcm[:, 1]) >> 1).astype(pcm.dtype)
+        return (pcm.astype(np.int64) // channels).sum(axis=1).astype(pcm.dtype)
+
+    def _iter_pcm_blocks(self, path, fmt, block_frames, sample_rate=None):
+        """Décode `path` par blocs de block_frames échantillons PCM 16 bits mono.
+
+        WAV/FLAC/AIFF sont lus par soundfile ; les autres formats par un ffmpeg dont la sortie est
+        consommée au fil de l'eau. Avec sample_rate, ffmpeg rééchantillonne et mixe lui-même en mono,
+        comme _decode_pipe (relecture d'un fichier que l'on vient d'encoder).
+        """
+        if fmt in SOUNDFILE_FORMATS:
+            with sf.SoundFile(path) as audio_file:
+                while True:
+                    pcm = audio_file.read(block_frames, dtype='int16', always_2d=True)
+                    if not len(pcm):
+                        break
+                    yield self._downmix_pcm(pcm)
+            return
+        args = [AudioSegment.converter, '-hide_banner', '-loglevel', 'error', '-i', path, '-vn']
+        if sample_rate is not None:
+            channels = 1
+            args += ['-ac', '1', '-ar', str(sample_rate)]
+        else:
+            channels = int(self._probe_audio_stream(path)['channels'])
+        args += ['-acodec', 'pcm_s16le', '-f', 's16le', 'pipe:1']
+        frame_bytes = 2 * channels
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                chunk = process.stdout.read(block_frames * frame_bytes)
+                if not chunk:
+                    break
+                usable = len(chunk) // frame_bytes * frame_bytes
+                yield self._downmix_pcm(np.frombuffer(chunk[:usable], dtype=np.int16).reshape(-1, channels))
+        finally:
+            process.stdout.close()
+            process.wait()
+
+    @staticmethod
+    def _probe_audio_stream(path):
+        info = mediainfo_json(path)
+        return next(stream for stream in info['streams'] if stream['codec_type'] == 'audio')
+
+    def _stream_length(self, path, fmt, sample_rate=None):
+        # Nombre d'échantillons décodés ; les formats lossy imposent une passe de comptage
+        if fmt in SOUNDFILE_FORMATS:
+            return sf.info(path).frames
+        return sum(len(pcm) for pcm in self._iter_pcm_blocks(path, fmt, STREAM_BLOCK_SEGMENTS * 4096, sample_rate))
+
+    def _stream_sample_rate(self, path, fmt):
+        if fmt in SOUNDFILE_FORMATS:
+            return sf.info(path).samplerate
+        return int(self._probe_audio_stream(path)['sample_rate'])
+
+    def _open_stream_encoder(self, output_path, fmt, sample_rate):
+        if fmt in SOUNDFILE_FORMATS:
+            return sf.SoundFile(output_path, 'w', samplerate=sample_rate, channels=1, format=SOUNDFILE_FORMATS[fmt], subtype='PCM_16')
+        if fmt in FFMPEG_PIPE_MUXERS:
+            return FfmpegStreamEncoder(output_path, fmt, sample_rate)
+        raise ValueError(f"Le mode streaming ne prend pas en charge le format {fmt}.")
+
+    @staticmethod
+    def _block_positions(segment_indices, block_segments):
+        # Pour chaque bloc de block_segments segments : positions (dans l'ordre des bits) des bits qu'il porte
+        order = np.argsort(segment_indices, kind='stable')
+        sorted_segments = segment_indices[order]
+        num_blocks = int(sorted_segments[-1]) // block_segments + 1 if len(sorted_segments) else 0
+        bounds = np.searchsorted(sorted_segments, np.arange(num_blocks + 1) * block_segments)
+        return [order[bounds[k]:bounds[k + 1]] for k in range(num_blocks)]
+
+    def _stream_embed_pass(self, input_path, fmt_in, output_path, fmt_out, sample_rate, segment_length, schedule, signs, strength, method, dwt_level, dwt_wavelet, dwt_coeff_type):
+        """Une passe d'insertion : décodage par blocs alignés sur les segments, ajout de s * delta
+        sur les segments porteurs du bloc, encodage immédiat du bloc."""
+        block_segments = STREAM_BLOCK_SEGMENTS
+        positions = self._block_positions(schedule.segment_indices, block_segments)
+        encoder = self._open_stream_encoder(output_path, fmt_out, sample_rate)
+        try:
+            for block_index, pcm in enumerate(self._iter_pcm_blocks(input_path, fmt_in, block_segments * segment_length)):
+                block = pcm.astype(np.float32) / 32768.0
+                if block_index < len(positions) and len(positions[block_index]):
+                    bits = positions[block_index]
+                    rows = self._delta_rows(schedule.coeff_indices[bits], signs[bits], segment_length, method, dwt_level, dwt_wavelet, dwt_coeff_type)
+                    frames = self._segment_frames(block, segment_length)
+                    frames[schedule.segment_indices[bits] - block_index * block_segments] += np.float32(strength) * rows
+                encoder.write(self._to_pcm16(block))
+        finally:
+            encoder.close()
+
+    def _stream_extract(self, path, fmt, audio_len, watermark_message_length, segment_length, seed, method, dwt_level, dwt_wavelet, dwt_coeff_type, sample_rate=None):
+        # Extraction par blocs : seuls les bits (N octets) et un bloc de signal sont en mémoire
+        segment_length, redundancy, rep_length, total_data_bits = self._extract_plan(audio_len, watermark_message_length, segment_length)
+        schedule = self._method_schedule(method, seed, audio_len, segment_length, max(redundancy, 1) * rep_length, dwt_level, dwt_wavelet)
+        block_segments = STREAM_BLOCK_SEGMENTS
+        positions = self._block_positions(schedule.segment_indices, block_segments)
+        soft = self.params.decision == "soft"
+        extracted = np.zeros(len(schedule), dtype=np.float64 if soft else np.uint8)
+        for block_index, pcm in enumerate(self._iter_pcm_blocks(path, fmt, block_segments * segment_length, sample_rate)):
+            if block_index >= len(positions):
+                break
+            bits = positions[block_index]
+            if len(bits):
+                block_schedule = KeySchedule(schedule.segment_indices[bits] - block_index * block_segments, schedule.coeff_indices[bits])
+                block = pcm.astype(np.float32) / 32768.0
+                if soft:
+                    extracted[bits] = self._extract_llr(
+                        method, block, segment_length, block_schedule, self.params.modulation_strength,
+                        dwt_level, dwt_wavelet, dwt_coeff_type
+                    )
+                else:
+                    extracted[bits] = self._extract_bits(method, block, segment_length, block_schedule, dwt_level, dwt_wavelet, dwt_coeff_type)
+        if soft:
+            return self._decode_llr(extracted, redundancy, rep_length, total_data_bits)["extracted_watermark"]
+        return self._decode_bits(extracted, redundancy, rep_length, total_data_bits)
+
+    def embed_watermark_stream(self, input_path, output_path, watermark, segment_length=None, seed=None, modulation_strength=None, fmt="wav", method="DCT", dwt_level=None, dwt_wavelet=None, dwt_coeff_type=None, search_mode="bisect", verify_lossless=True):
+        """Équivalent de embed_watermark_with_test pour les fichiers longs, à mémoire bornée.
+
+        L'entrée est décodée par blocs de STREAM_BLOCK_SEGMENTS segments, chaque bloc est marqué puis
+        encodé aussitôt dans un fichier candidat ; la vérification relit ce fichier de la même façon.
+        Seuls O(bloc) échantillons et les tables de bits restent en mémoire. Pour une source PCM 16 bits,
+        le fichier retenu est identique à celui du chemin en mémoire. Retourne un EmbedResult dont
+        output_path désigne le fichier retenu.
+        """
+        segment_length = segment_length or self.params.segment_length
+        seed = seed or self.params.seed
+        current_modulation = modulation_strength if modulation_strength is not None else self.params.modulation_strength
+        max_modulation = 0.5
+        watermark_fixed = watermark.ljust(12)[:12]
+        dwt_level = dwt_level if dwt_level is not None else self.params.dwt_level
+        dwt_wavelet = dwt_wavelet if dwt_wavelet is not None else self.params.dwt_wavelet
+        dwt_coeff_type = dwt_coeff_type if dwt_coeff_type is not None else self.params.dwt_coeff_type
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Mode de recherche inconnu : {search_mode}")
+        fmt_in = sniff_audio_format(read_audio_header(input_path)) or get_audio_format(input_path)
+        if fmt_in is None:
+            raise ValueError("Format de fichier non supporté.")
+
+        sample_rate = self._stream_sample_rate(input_path, fmt_in)
+        audio_len = self._stream_length(input_path, fmt_in)
+        embed_length, signs = self._embed_plan(audio_len, watermark_fixed, segment_length)
+        schedule = self._method_schedule(method, seed, audio_len, embed_length, len(signs), dwt_level, dwt_wavelet)
+        signs = np.asarray(signs)
+        self._report_progress(10)
+        candidates = []
+        decoded_length = {}
+
+        def attempt(strength):
+            print(f"Tentative (streaming) avec modulation_strength = {strength}")
+            candidate_path = f"{output_path}.{len(candidates)}.{fmt}"
+            candidates.append(candidate_path)
+            self._stream_embed_pass(input_path, fmt_in, candidate_path, fmt, sample_rate, embed_length, schedule, signs, strength, method, dwt_level, dwt_wavelet, dwt_coeff_type)
+            result = EmbedResult(None, strength, 0, None, output_path=candidate_path)
+            if is_lossless(fmt) and not verify_lossless:
+                return result
+            check_rate = None if fmt in SOUNDFILE_FORMATS else sample_rate
+            if 'value' not in decoded_length:
+                decoded_length['value'] = self._stream_length(candidate_path, fmt, check_rate)
+            try:
+                extracted = self._stream_extract(candidate_path, fmt, decoded_length['value'], len(watermark_fixed), segment_length, seed, method, dwt_level, dwt_wavelet, dwt_coeff_type, check_rate)
+            except Exception as e:
+                extracted = ""
+            if extracted.strip() == watermark_fixed.strip():
+                return result
+            print(f"Échec avec modulation_strength = {strength}")
+            return None
+
+        try:
+            result, final_modulation, iterations = self._search_modulation(
+                attempt, current_modulation, max_modulation, search_mode
+            )
+            if result is not None:
+                os.replace(result.output_path, output_path)
+        finally:
+            # Candidats écartés (ou abandonnés sur erreur) ; le fichier retenu a déjà été renommé
+            for candidate_path in candidates:
+                if os.path.exists(candidate_path):
+                    os.remove(candidate_path)
+        if result is None:
+            raise ValueError("Impossible d'insérer correctement le watermark dans les limites de modulation.")
+        print(f"Watermark inséré (streaming) avec modulation_strength = {final_modulation} ({iterations} tentative(s))")
+        result.output_path = output_path
+        result.modulation = final_modulation
+        result.iterations = iterations
+        return result
 
     def pad_lossless(self, input_path, output_path, fmt):
         orig_size = os.path.getsize(input_path)
@@ -1143,8 +2653,376 @@ class AudioWatermarker:
                 with open(output_path, "ab") as f:
                     f.write(b"\x00" * diff)
 
-# Instance globale du watermarker
-watermarker = AudioWatermarker()
+# -------------- Tâches asynchrones --------------
+# Pool de processus créé au premier job (contexte spawn : pas de fork d'un worker web multi-thread).
+# Les workers écrivent leur progression directement dans le TaskStore partagé.
+task_store = TaskStore(TASK_DB_PATH)
+temp_files = TempFileManager(TEMP_SPOOL_DIR)
+pcm_cache = DecodedAudioCache(PCM_CACHE_DIR, memory_bytes=PCM_CACHE_MEMORY_BYTES // (JOB_WORKERS * WEB_CONCURRENCY))
+_job_pool = None
+_job_pool_lock = threading.Lock()
+
+def _job_progress(task_id):
+    def report(progress):
+        task_store.set_progress(task_id, progress)
+    return report
+
+def get_job_pool(broken=None):
+    """Pool de processus des jobs, recréé s'il est cassé (worker tué, par exemple par l'OOM killer).
+
+    broken : pool dont submit() vient de lever BrokenProcessPool. Les jobs en cours ou en file dans
+    un pool cassé échouent avec BrokenProcessPool, et leurs tâches passent en erreur (_finish_job).
+    """
+    global _job_pool
+    with _job_pool_lock:
+        if _job_pool is not None and (_job_pool is broken or getattr(_job_pool, '_broken', False)):
+            _job_pool.shutdown(wait=False, cancel_futures=True)
+            _job_pool = None
+        if _job_pool is None:
+            _job_pool = ProcessPoolExecutor(max_workers=JOB_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _job_pool
+
+def job_output_path(task_id, fmt):
+    return os.path.join(temp_files.directory, f"{task_id}.{fmt}")
+
+def _job_source(job_input):
+    # Entrée d'un job : chemin dans le spool, ou octets d'un petit upload lossless
+    return io.BytesIO(job_input) if isinstance(job_input, bytes) else job_input
+
+def run_embed_job(task_id, job_input, output_path, watermark, params, fmt_out, search_mode, verify_lossless, streaming):
+    """Insertion exécutée dans un processus du pool ; le fichier encodé est écrit dans output_path."""
+    watermarker = AudioWatermarker(params, progress=_job_progress(task_id))
+    if streaming:
+        # Fichier long : décodage, insertion et encodage par blocs, mémoire bornée
+        result = watermarker.embed_watermark_stream(
+            job_input, output_path, watermark, params.segment_length, params.seed,
+            params.modulation_strength, fmt_out, params.method, params.dwt_level, params.dwt_wavelet,
+            params.dwt_coeff_type, search_mode=search_mode, verify_lossless=verify_lossless
+        )
+    else:
+        audio, sample_rate, _ = watermarker.audio_to_numpy(_job_source(job_input))
+        result = watermarker.embed_watermark_with_test(
+            (audio, sample_rate), watermark, params.segment_length, params.seed,
+            params.modulation_strength, fmt_out, params.method, params.dwt_level, params.dwt_wavelet,
+            params.dwt_coeff_type, search_mode=search_mode, verify_lossless=verify_lossless
+        )
+        # Le fichier de sortie est l'artefact déjà encodé et vérifié : pas de second encodage
+        with open(output_path, 'wb') as output_file:
+            output_file.write(result.audio_bytes)
+    return {"final_modulation": result.modulation, "iterations": result.iterations}
+
+def load_cached_audio(watermarker, job_input, audio_id=None, persist=None):
+    """PCM d'une entrée de job via le cache décodé : décodage seulement au premier passage d'un contenu.
+    Sans job_input, l'audio doit déjà être en cache sous audio_id ; persist : voir DecodedAudioCache.put.
+    Renvoie (audio_id, échantillons, fréquence)."""
+    if audio_id is None:
+        audio_id = DecodedAudioCache.content_hash(job_input)
+    cached = pcm_cache.get(audio_id)
+    if cached is not None and persist and not pcm_cache.on_disk(audio_id):
+        # Déjà en mémoire dans ce processus seulement : l'upload explicite doit servir aux autres
+        cached = pcm_cache.put(audio_id, *cached, persist=True)
+    elif cached is None:
+        if job_input is None:
+            raise ValueError(f"Audio inconnu ou expiré : {audio_id}")
+        audio, sample_rate, _ = watermarker.audio_to_numpy(_job_source(job_input))
+        cached = pcm_cache.put(audio_id, audio, sample_rate, persist)
+    return (audio_id,) + tuple(cached)
+
+def run_decode_job(task_id, job_input):
+    """Décodage d'un upload dans le cache, pour les appels ultérieurs par audio_id."""
+    audio_id, audio, sample_rate = load_cached_audio(AudioWatermarker(), job_input, persist=True)
+    return {"audio_id": audio_id, "sample_rate": sample_rate, "duration": len(audio) / sample_rate}
+
+def run_extract_job(task_id, job_input, watermark_length, params, audio_id=None, sync_max_offset=None):
+    """Extraction exécutée dans un processus du pool ; avec sync_max_offset, le décalage d'origine
+    est d'abord recherché dans [-sync_max_offset, sync_max_offset] et le signal réaligné."""
+    watermarker = AudioWatermarker(params, progress=_job_progress(task_id))
+    audio_id, audio, _ = load_cached_audio(watermarker, job_input, audio_id)
+    watermarker._report_progress(40)
+    sync = {}
+    if sync_max_offset is not None:
+        offset, peak_ratio = watermarker.find_offset(
+            audio, watermark_length, params.segment_length, params.seed, params.method,
+            params.dwt_level, params.dwt_wavelet, params.dwt_coeff_type, sync_max_offset
+        )
+        audio = watermarker.align_audio(audio, offset)
+        sync = {"offset": offset, "sync_peak_ratio": peak_ratio}
+    watermarker._report_progress(60)
+    if params.decision == "soft":
+        # Décision souple : CRC et confiance par bit du message en plus du texte
+        soft = watermarker.extract_watermark_soft(
+            audio, watermark_length, params.segment_length, params.seed, params.modulation_strength,
+            params.method, params.dwt_level, params.dwt_wavelet, params.dwt_coeff_type
+        )
+        return dict(soft, audio_id=audio_id, **sync)
+    if params.method == "DCT":
+        extracted_watermark = watermarker.extract_watermark(
+            audio, watermark_length, params.segment_length, params.seed, params.modulation_strength
+        )
+    else:
+        extracted_watermark = watermarker.extract_watermark_dwt_dct(
+            audio, watermark_length, params.segment_length, params.seed, params.modulation_strength,
+            params.dwt_level, params.dwt_wavelet, params.dwt_coeff_type
+        )
+    return dict({"extracted_watermark": extracted_watermark, "audio_id": audio_id}, **sync)
+
+def run_detect_job(task_id, job_input, candidates, audio_id=None):
+    """Détection multi-candidats : un seul décodage (via le cache), transformées partagées."""
+    watermarker = AudioWatermarker(progress=_job_progress(task_id))
+    audio_id, audio, _ = load_cached_audio(watermarker, job_input, audio_id)
+    watermarker._report_progress(60)
+    return {"audio_id": audio_id, "candidates": watermarker.detect_watermark(audio, candidates)}
+
+def _finish_job(task_id, job_input, output_path, done, future):
+    if isinstance(job_input, str):
+        temp_files.schedule(job_input, 10)
+    if output_path:
+        temp_files.schedule(output_path, JOB_RESULT_TTL)
+    try:
+        result = future.result()
+    except BrokenProcessPool as e:
+        task_store.update(task_id, status="error", error="Processus de traitement interrompu (mémoire insuffisante ?)")
+        done.set_exception(e)
+        return
+    except Exception as e:
+        task_store.update(task_id, status="error", error=str(e))
+        done.set_exception(e)
+        return
+    task_store.update(task_id, status="completed", progress=100, result=result)
+    done.set_result(result)
+
+def submit_job(task_id, job_input, job, *args, output_path=None):
+    """Soumet `job(task_id, job_input, *args)` au pool ; une entrée sur disque est supprimée à la fin
+    du job, le fichier résultat éventuel (output_path) JOB_RESULT_TTL secondes plus tard.
+
+    Le Future renvoyé n'est résolu qu'une fois l'état de la tâche mis à jour dans le TaskStore.
+    """
+    done = Future()
+    pool = get_job_pool()
+    try:
+        future = pool.submit(job, task_id, job_input, *args)
+    except BrokenProcessPool:
+        # Cassure constatée à la soumission : nouveau pool, la tâche n'y a pas encore été confiée
+        future = get_job_pool(broken=pool).submit(job, task_id, job_input, *args)
+    future.add_done_callback(functools.partial(_finish_job, task_id, job_input, output_path, done))
+    return done
+
+def spool_upload(file, keep_on_disk=False):
+    """Entrée d'un job pour un upload : ses octets si c'est un petit fichier lossless (reconnu au
+    contenu, décodé ensuite en mémoire), sinon le chemin d'une copie dans le spool."""
+    if (not keep_on_disk and sniff_audio_format(read_audio_header(file.stream)) is not None
+            and request.content_length is not None and request.content_length <= INGEST_MEMORY_THRESHOLD):
+        return file.read()
+    input_path = temp_files.new_path(f".{get_audio_format(file.filename)}")
+    file.save(input_path)
+    return input_path
+
+def request_audio_source(fields):
+    """Entrée d'un job d'analyse : l'audio_id d'un fichier déjà décodé, sinon le fichier joint.
+    Renvoie (job_input, audio_id, réponse d'erreur ou None)."""
+    audio_id = fields.get('audio_id')
+    if audio_id:
+        if not DecodedAudioCache.is_valid_id(audio_id):
+            return None, None, (jsonify({"error": "audio_id invalide"}), 400)
+        if not pcm_cache.contains(audio_id):
+            return None, None, (jsonify({"error": "Audio inconnu ou expiré, il doit être renvoyé"}), 404)
+        return None, audio_id, None
+    if 'audio_file' not in request.files:
+        return None, None, (jsonify({"error": "Aucun fichier audio fourni"}), 400)
+    file = request.files['audio_file']
+    if file.filename == '':
+        return None, None, (jsonify({"error": "Aucun fichier sélectionné"}), 400)
+    # Upload gardé en mémoire (petit fichier lossless) ou sauvegardé dans le spool
+    return spool_upload(file), None, None
+
+def watermarked_filename(filename):
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}_watermarked{ext}"
+
+def is_flag_set(fields, key, default=''):
+    return str(fields.get(key, default)).lower() in ('1', 'true', 'yes')
+
+def parse_embed_fields(fields):
+    """Paramètres d'insertion d'un formulaire (ou d'un fichier d'un lot) :
+    (watermark sur 12 caractères, params, search_mode, verify_lossless, streaming). ValueError si invalides."""
+    watermark_text = fields.get('watermark_text', '')
+    if not watermark_text:
+        raise ValueError("Texte du watermark requis")
+    if len(watermark_text) > 12:
+        raise ValueError("Le texte du watermark ne peut dépasser 12 caractères")
+    params = WatermarkParams.from_form(fields)
+    search_mode = fields.get('search_mode', 'bisect')
+    if search_mode not in SEARCH_MODES:
+        raise ValueError(f"Mode de recherche invalide (valeurs possibles : {', '.join(SEARCH_MODES)})")
+    if params.embed_mode not in EMBED_MODES:
+        raise ValueError(f"Mode d'insertion invalide (valeurs possibles : {', '.join(EMBED_MODES)})")
+    if params.decision not in DECISIONS:
+        raise ValueError(f"Décision invalide (valeurs possibles : {', '.join(DECISIONS)})")
+    verify_lossless = str(fields.get('verify_lossless', '1')).lower() not in ('0', 'false', 'no')
+    return watermark_text.ljust(12)[:12], params, search_mode, verify_lossless, is_flag_set(fields, 'streaming')
+
+def parse_extract_fields(fields):
+    """Paramètres d'extraction : (watermark_length, params, sync_max_offset). ValueError si invalides."""
+    watermark_length = int(fields.get('watermark_length', 12))
+    params = WatermarkParams.from_form(fields)
+    if params.decision not in DECISIONS:
+        raise ValueError(f"Décision invalide (valeurs possibles : {', '.join(DECISIONS)})")
+    # sync=1 : recherche du décalage d'origine (fichier rogné, silence ajouté) avant extraction
+    sync_max_offset = None
+    if is_flag_set(fields, 'sync'):
+        sync_max_offset = int(fields.get('sync_max_offset', min(params.segment_length, SYNC_MAX_OFFSET_LIMIT)))
+        if not 0 <= sync_max_offset <= SYNC_MAX_OFFSET_LIMIT:
+            raise ValueError(f"sync_max_offset doit être compris entre 0 et {SYNC_MAX_OFFSET_LIMIT}")
+    return watermark_length, params, sync_max_offset
+
+def job_result_payload(task_id, task, result):
+    """Corps JSON du résultat d'une tâche terminée, au format des anciennes réponses synchrones."""
+    payload = {"success": True, "task_id": task_id}
+    if task["kind"] == "embed":
+        with open(task["output_path"], 'rb') as output_file:
+            payload["file_data"] = base64.b64encode(output_file.read()).decode('utf-8')
+        payload["filename"] = task["filename"]
+    payload.update(result)
+    return payload
+
+def job_result_response(task_id, task, result, response_format="binary"):
+    """Réponse d'une tâche terminée. Une insertion renvoie le fichier encodé tel quel (Content-Length,
+    requêtes Range), la force finale et le nombre de tentatives passant en en-têtes ;
+    response_format="base64" renvoie l'ancien JSON avec file_data."""
+    if task["kind"] != "embed" or response_format == "base64":
+        return jsonify(job_result_payload(task_id, task, result))
+    fmt = get_audio_format(task["output_path"])
+    response = send_file(
+        task["output_path"], mimetype=AUDIO_MIMETYPES.get(fmt, 'application/octet-stream'),
+        as_attachment=True, download_name=task["filename"], conditional=True
+    )
+    response.headers["X-Task-Id"] = task_id
+    response.headers["X-Final-Modulation"] = str(result["final_modulation"])
+    response.headers["X-Iterations"] = str(result["iterations"])
+    return response
+
+def archive_member_name(name):
+    # Chemin relatif sûr pour une entrée d'archive : ni racine, ni composant '..'
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    return '/'.join(parts)
+
+def spool_batch_uploads():
+    """Fichiers d'un lot, copiés dans le spool : champs multipart audio_files (ou audio_file répété)
+    et membres audio des archives zip du champ archive. Renvoie la liste [(nom, chemin)]."""
+    uploads = []
+    try:
+        for file in request.files.getlist('audio_files') + request.files.getlist('audio_file'):
+            if file.filename:
+                uploads.append((file.filename, spool_upload(file, keep_on_disk=True)))
+        for archive in request.files.getlist('archive'):
+            with zipfile.ZipFile(archive.stream) as zip_file:
+                members = [
+                    info for info in zip_file.infolist()
+                    if not info.is_dir() and get_audio_format(info.filename) in SUPPORTED_EXTENSIONS
+                ]
+                if sum(info.file_size for info in members) > BATCH_MAX_ARCHIVE_BYTES:
+                    raise ValueError(f"Archive trop volumineuse une fois décompressée (max {BATCH_MAX_ARCHIVE_BYTES} octets)")
+                if len(uploads) + len(members) > BATCH_MAX_FILES:
+                    raise ValueError(f"Au plus {BATCH_MAX_FILES} fichiers par lot")
+                for info in members:
+                    input_path = temp_files.new_path(f".{get_audio_format(info.filename)}")
+                    # Ajouté avant la copie : un membre illisible à moitié écrit est supprimé avec les autres
+                    uploads.append((archive_member_name(info.filename), input_path))
+                    try:
+                        with zip_file.open(info) as source, open(input_path, 'wb') as target:
+                            shutil.copyfileobj(source, target)
+                    except (zlib.error, EOFError, RuntimeError, NotImplementedError) as e:
+                        # Données compressées corrompues ou tronquées, membre chiffré, compression non prise en charge
+                        raise ValueError(f"Membre d'archive illisible ({info.filename}) : {e}") from e
+    except (ValueError, zipfile.BadZipFile):
+        for _, input_path in uploads:
+            temp_files.schedule(input_path, 0)
+        raise
+    return uploads
+
+def prepare_batch_entries(kind, uploads, shared, file_params):
+    """Valide les paramètres de chaque fichier du lot. Renvoie (entrées à soumettre, lignes des fichiers
+    refusés) ; une entrée est (ligne NDJSON, job_input, job, arguments du job, output_path, champs de
+    la tâche), la tâche n'étant créée qu'à la soumission du job."""
+    entries, rejected = [], []
+    for index, (filename, job_input) in enumerate(uploads):
+        task_id = str(uuid.uuid4())
+        line = {"index": index, "filename": filename, "task_id": task_id}
+        fields = dict(shared, **file_params.get(filename, {}))
+        try:
+            if kind == "embed":
+                watermark, params, search_mode, verify_lossless, streaming = parse_embed_fields(fields)
+                fmt_out = get_audio_format(filename)
+                streamable = fmt_out in SOUNDFILE_FORMATS or fmt_out in FFMPEG_PIPE_MUXERS
+                streaming = streamable and (streaming or os.path.getsize(job_input) >= STREAMING_THRESHOLD_BYTES)
+                output_path = job_output_path(task_id, fmt_out)
+                task_fields = {"kind": "embed", "filename": watermarked_filename(filename), "output_path": output_path}
+                job_args = (output_path, watermark, params, fmt_out, search_mode, verify_lossless, streaming)
+                entries.append((line, job_input, run_embed_job, job_args, output_path, task_fields))
+            else:
+                watermark_length, params, sync_max_offset = parse_extract_fields(fields)
+                job_args = (watermark_length, params, None, sync_max_offset)
+                entries.append((line, job_input, run_extract_job, job_args, None, {"kind": "extract"}))
+        except (ValueError, TypeError) as e:
+            temp_files.schedule(job_input, 0)
+            rejected.append(dict(line, status="error", error=str(e)))
+    return entries, rejected
+
+def _schedule_batch_result(output_path, future):
+    temp_files.schedule(output_path, JOB_RESULT_TTL)
+
+def stream_batch(batch_id, kind, entries, rejected):
+    """Générateur NDJSON d'un lot : une ligne par fichier dès la fin de son job, puis une ligne de bilan.
+
+    Au plus BATCH_IN_FLIGHT jobs du lot sont en file à la fois, pour laisser passer les autres
+    requêtes ; si le client se déconnecte, les fichiers pas encore soumis sont supprimés.
+    La tâche d'un fichier est créée à la soumission de son job ; chaque ligne émise repousse
+    l'expiration du lot et des fichiers terminés, et les fichiers marqués restent disponibles
+    JOB_RESULT_TTL secondes après la fin du lot (et non de leur propre job).
+    """
+    counts = {"completed": 0, "error": len(rejected)}
+    waiting = list(reversed(entries))
+    running = {}
+    finished_ids = []
+    output_paths = []
+    try:
+        for line in rejected:
+            yield json.dumps(line) + "\n"
+        while waiting or running:
+            while waiting and len(running) < BATCH_IN_FLIGHT:
+                line, job_input, job, job_args, output_path, task_fields = waiting.pop()
+                task_store.create(line["task_id"], **task_fields)
+                running[submit_job(line["task_id"], job_input, job, *job_args)] = (line, output_path)
+            finished, _ = wait_futures(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                line, output_path = running.pop(future)
+                if output_path:
+                    output_paths.append(output_path)
+                try:
+                    line = dict(line, status="completed", **future.result())
+                except Exception as e:
+                    line = dict(line, status="error", error=str(e))
+                counts[line["status"]] += 1
+                finished_ids.append(line["task_id"])
+                task_store.update(batch_id, progress=100 * len(finished_ids) // len(entries))
+                task_store.touch(finished_ids)
+                yield json.dumps(line) + "\n"
+        task_store.update(batch_id, status="completed", progress=100)
+        task_store.touch(finished_ids)
+        summary = {"batch_id": batch_id, "completed": counts["completed"], "errors": counts["error"]}
+        if kind == "embed":
+            summary["archive_url"] = f"/api/batch/{batch_id}/archive"
+        yield json.dumps(summary) + "\n"
+    finally:
+        for _, job_input, *_ in waiting:
+            temp_files.schedule(job_input, 0)
+        # Résultats du lot : délai compté depuis sa fin ; un job encore en cours à la déconnexion
+        # du client programme le sien en se terminant
+        for output_path in output_paths:
+            temp_files.schedule(output_path, JOB_RESULT_TTL)
+        for future, (_, output_path) in running.items():
+            if output_path:
+                future.add_done_callback(functools.partial(_schedule_batch_result, output_path))
 
 @app.route('/')
 def index():
@@ -1154,7 +3032,6 @@ def index():
 def embed_watermark():
     try:
         task_id = str(uuid.uuid4())
-        active_tasks[task_id] = {"status": "processing", "progress": 0}
         
         # Récupération des paramètres
         if 'audio_file' not in request.files:
@@ -1164,177 +3041,236 @@ def embed_watermark():
         if file.filename == '':
             return jsonify({"error": "Aucun fichier sélectionné"}), 400
             
-        watermark_text = request.form.get('watermark_text', '')
-        if not watermark_text:
-            return jsonify({"error": "Texte du watermark requis"}), 400
-            
-        if len(watermark_text) > 12:
-            return jsonify({"error": "Le texte du watermark ne peut dépasser 12 caractères"}), 400
-            
-        # Paramètres optionnels
-        method = request.form.get('method', 'DCT')
-        segment_length = int(request.form.get('segment_length', watermarker.segment_length))
-        seed = int(request.form.get('seed', watermarker.seed))
-        modulation_strength = float(request.form.get('modulation_strength', watermarker.modulation_strength))
-        band_lower_pct = float(request.form.get('band_lower_pct', watermarker.band_lower_pct))
-        band_upper_pct = float(request.form.get('band_upper_pct', watermarker.band_upper_pct))
-        dwt_level = int(request.form.get('dwt_level', watermarker.dwt_level))
-        dwt_wavelet = request.form.get('dwt_wavelet', watermarker.dwt_wavelet)
-        dwt_coeff_type = request.form.get('dwt_coeff_type', watermarker.dwt_coeff_type)
-        n_coeffs = int(request.form.get('n_coeffs', watermarker.n_coeffs))
+        # Texte du watermark et paramètres optionnels, propres à cette requête
+        try:
+            watermark_fixed, params, search_mode, verify_lossless, streaming = parse_embed_fields(request.form)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        # wait=1 : réponse synchrone complète, comme avant l'introduction des tâches asynchrones
+        wait = is_flag_set(request.form, 'wait')
+        response_format = request.values.get('response_format', 'binary')
+        if response_format not in RESPONSE_FORMATS:
+            return jsonify({"error": f"Format de réponse invalide (valeurs possibles : {', '.join(RESPONSE_FORMATS)})"}), 400
         
-        # Sauvegarde temporaire du fichier
-        temp_input = tempfile.NamedTemporaryFile(delete=False, suffix=f".{get_audio_format(file.filename)}")
-        file.save(temp_input.name)
-        temp_input.close()
+        fmt_out = get_audio_format(file.filename)
+        streamable = fmt_out in SOUNDFILE_FORMATS or fmt_out in FFMPEG_PIPE_MUXERS
         
-        active_tasks[task_id]["progress"] = 20
+        # Upload gardé en mémoire (petit fichier lossless) ou sauvegardé dans le spool
+        job_input = spool_upload(file, keep_on_disk=streamable and streaming)
+        streaming = streamable and isinstance(job_input, str) and (streaming or os.path.getsize(job_input) >= STREAMING_THRESHOLD_BYTES)
+        output_path = job_output_path(task_id, fmt_out)
+        task_store.create(
+            task_id,
+            kind="embed",
+            filename=watermarked_filename(file.filename),
+            output_path=output_path
+        )
         
-        # Configuration du watermarker
-        watermarker.segment_length = segment_length
-        watermarker.seed = seed
-        watermarker.modulation_strength = modulation_strength
-        watermarker.band_lower_pct = band_lower_pct
-        watermarker.band_upper_pct = band_upper_pct
-        watermarker.dwt_level = dwt_level
-        watermarker.dwt_wavelet = dwt_wavelet
-        watermarker.dwt_coeff_type = dwt_coeff_type
-        watermarker.n_coeffs = n_coeffs
+        # Traitement audio et insertion du watermark dans le pool de processus
+        future = submit_job(
+            task_id, job_input, run_embed_job, output_path, watermark_fixed, params,
+            fmt_out, search_mode, verify_lossless, streaming, output_path=output_path
+        )
+        if wait:
+            return job_result_response(task_id, task_store.get(task_id), future.result(), response_format)
         
-        # Traitement audio
-        audio, sample_rate, fmt_in = watermarker.audio_to_numpy(temp_input.name)
-        fmt_out = get_audio_format(file.filename)
+        return jsonify({"success": True, "task_id": task_id, "status": "queued"}), 202
         
-        active_tasks[task_id]["progress"] = 40
+    except Exception as e:
+        task_store.update(task_id, status="error", error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/extract', methods=['POST'])
+def extract_watermark():
+    try:
+        task_id = str(uuid.uuid4())
         
-        watermark_fixed = watermark_text.ljust(12)[:12]
+        # Récupération des paramètres, optionnels et propres à cette requête
+        try:
+            watermark_length, params, sync_max_offset = parse_extract_fields(request.form)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        wait = is_flag_set(request.form, 'wait')
         
-        # Insertion du watermark
-        if method == "DCT":
-            watermarked_audio, final_modulation = watermarker.embed_watermark_with_test(
-                (audio, sample_rate), watermark_fixed, segment_length, seed, 
-                modulation_strength, fmt_out, method
-            )
-        else:
-            watermarked_audio, final_modulation = watermarker.embed_watermark_with_test(
-                (audio, sample_rate), watermark_fixed, segment_length, seed, 
-                modulation_strength, fmt_out, method, dwt_level, dwt_wavelet, dwt_coeff_type
-            )
+        # Fichier joint, ou audio_id d'un fichier déjà envoyé sur /api/upload
+        job_input, audio_id, error = request_audio_source(request.form)
+        if error:
+            return error
         
-        active_tasks[task_id]["progress"] = 80
+        task_store.create(task_id, kind="extract")
         
-        # Génération du fichier de sortie
-        output_bytes = watermarker.numpy_to_audio_bytes(watermarked_audio, sample_rate, fmt_out)
+        # Extraction du watermark dans le pool de processus
+        future = submit_job(task_id, job_input, run_extract_job, watermark_length, params, audio_id, sync_max_offset)
+        if wait:
+            return jsonify(job_result_payload(task_id, task_store.get(task_id), future.result()))
+        
+        return jsonify({"success": True, "task_id": task_id, "status": "queued"}), 202
+        
+    except Exception as e:
+        task_store.update(task_id, status="error", error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/detect', methods=['POST'])
+def detect_watermark():
+    """Essaie une liste de jeux de paramètres candidats sur un fichier décodé une seule fois.
+
+    Multipart (audio_file ou audio_id, candidates en JSON) ou corps JSON (audio_id, candidates).
+    Les autres champs servent de valeurs par défaut communes aux candidats.
+    """
+    try:
+        task_id = str(uuid.uuid4())
         
-        active_tasks[task_id]["progress"] = 100
-        active_tasks[task_id]["status"] = "completed"
+        payload = request.get_json(silent=True)
+        fields = payload if isinstance(payload, dict) else request.form
+        try:
+            candidate_list = fields.get('candidates', [])
+            if isinstance(candidate_list, str):
+                candidate_list = json.loads(candidate_list)
+            if not isinstance(candidate_list, list) or not candidate_list or not all(isinstance(c, dict) for c in candidate_list):
+                return jsonify({"error": "Liste de candidats requise (objets JSON de paramètres)"}), 400
+            if len(candidate_list) > DETECT_MAX_CANDIDATES:
+                return jsonify({"error": f"Au plus {DETECT_MAX_CANDIDATES} candidats par requête"}), 400
+            shared = {key: fields[key] for key in fields if key not in ('candidates', 'audio_id', 'wait')}
+            candidates = []
+            for candidate in candidate_list:
+                merged = dict(shared, **candidate)
+                candidates.append((WatermarkParams.from_form(merged), int(merged.get('watermark_length', 12))))
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": f"Candidats invalides : {e}"}), 400
+        wait = str(fields.get('wait', '')).lower() in ('1', 'true', 'yes')
         
-        # Nettoyage du fichier temporaire d'entrée
-        cleanup_file(temp_input.name, 10)
+        job_input, audio_id, error = request_audio_source(fields)
+        if error:
+            return error
         
-        # Retour du fichier encodé en base64
-        encoded_file = base64.b64encode(output_bytes).decode('utf-8')
+        task_store.create(task_id, kind="detect")
+        future = submit_job(task_id, job_input, run_detect_job, candidates, audio_id)
+        if wait:
+            return jsonify(job_result_payload(task_id, task_store.get(task_id), future.result()))
         
-        return jsonify({
-            "success": True,
-            "task_id": task_id,
-            "file_data": encoded_file,
-            "filename": f"{os.path.splitext(file.filename)[0]}_watermarked{os.path.splitext(file.filename)[1]}",
-            "final_modulation": final_modulation
-        })
+        return jsonify({"success": True, "task_id": task_id, "status": "queued"}), 202
         
     except Exception as e:
-        if task_id in active_tasks:
-            active_tasks[task_id]["status"] = "error"
-            active_tasks[task_id]["error"] = str(e)
+        task_store.update(task_id, status="error", error=str(e))
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/extract', methods=['POST'])
-def extract_watermark():
+@app.route('/api/upload', methods=['POST'])
+def upload_audio():
+    """Décode un fichier une fois pour toutes et renvoie son audio_id, utilisable ensuite par /api/extract."""
     try:
         task_id = str(uuid.uuid4())
-        active_tasks[task_id] = {"status": "processing", "progress": 0}
         
-        # Récupération des paramètres
         if 'audio_file' not in request.files:
             return jsonify({"error": "Aucun fichier audio fourni"}), 400
             
         file = request.files['audio_file']
         if file.filename == '':
             return jsonify({"error": "Aucun fichier sélectionné"}), 400
-            
-        watermark_length = int(request.form.get('watermark_length', 12))
-        
-        # Paramètres optionnels
-        method = request.form.get('method', 'DCT')
-        segment_length = int(request.form.get('segment_length', watermarker.segment_length))
-        seed = int(request.form.get('seed', watermarker.seed))
-        modulation_strength = float(request.form.get('modulation_strength', watermarker.modulation_strength))
-        band_lower_pct = float(request.form.get('band_lower_pct', watermarker.band_lower_pct))
-        band_upper_pct = float(request.form.get('band_upper_pct', watermarker.band_upper_pct))
-        dwt_level = int(request.form.get('dwt_level', watermarker.dwt_level))
-        dwt_wavelet = request.form.get('dwt_wavelet', watermarker.dwt_wavelet)
-        dwt_coeff_type = request.form.get('dwt_coeff_type', watermarker.dwt_coeff_type)
-        n_coeffs = int(request.form.get('n_coeffs', watermarker.n_coeffs))
-        
-        # Sauvegarde temporaire du fichier
-        temp_input = tempfile.NamedTemporaryFile(delete=False, suffix=f".{get_audio_format(file.filename)}")
-        file.save(temp_input.name)
-        temp_input.close()
-        
-        active_tasks[task_id]["progress"] = 30
-        
-        # Configuration du watermarker
-        watermarker.segment_length = segment_length
-        watermarker.seed = seed
-        watermarker.modulation_strength = modulation_strength
-        watermarker.band_lower_pct = band_lower_pct
-        watermarker.band_upper_pct = band_upper_pct
-        watermarker.dwt_level = dwt_level
-        watermarker.dwt_wavelet = dwt_wavelet
-        watermarker.dwt_coeff_type = dwt_coeff_type
-        watermarker.n_coeffs = n_coeffs
-        
-        # Traitement audio
-        audio, _, _ = watermarker.audio_to_numpy(temp_input.name)
-        
-        active_tasks[task_id]["progress"] = 60
-        
-        # Extraction du watermark
-        if method == "DCT":
-            extracted_watermark = watermarker.extract_watermark(
-                audio, watermark_length, segment_length, seed, modulation_strength
-            )
-        else:
-            extracted_watermark = watermarker.extract_watermark_dwt_dct(
-                audio, watermark_length, segment_length, seed, modulation_strength,
-                dwt_level, dwt_wavelet, dwt_coeff_type
-            )
         
-        active_tasks[task_id]["progress"] = 100
-        active_tasks[task_id]["status"] = "completed"
+        job_input = spool_upload(file)
+        task_store.create(task_id, kind="upload")
+        result = submit_job(task_id, job_input, run_decode_job).result()
         
-        # Nettoyage du fichier temporaire
-        cleanup_file(temp_input.name, 10)
-        
-        return jsonify({
-            "success": True,
-            "task_id": task_id,
-            "extracted_watermark": extracted_watermark
-        })
+        return jsonify(dict(success=True, **result))
         
     except Exception as e:
-        if task_id in active_tasks:
-            active_tasks[task_id]["status"] = "error"
-            active_tasks[task_id]["error"] = str(e)
+        task_store.update(task_id, status="error", error=str(e))
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/batch/<kind>', methods=['POST'])
+def batch_process(kind):
+    """Insertion ou extraction sur plusieurs fichiers (audio_files multiples et/ou archive zip).
+
+    Les champs du formulaire sont communs à tous les fichiers ; file_params (JSON, par nom de
+    fichier ou chemin dans l'archive) les surcharge fichier par fichier. La réponse est un flux
+    NDJSON : une ligne par fichier à la fin de son job, dans l'ordre d'achèvement, puis un bilan.
+    Les fichiers marqués restent disponibles via /api/result/<task_id> et /api/batch/<id>/archive.
+    """
+    if kind not in ("embed", "extract"):
+        return jsonify({"error": "Type de lot invalide (valeurs possibles : embed, extract)"}), 404
+    try:
+        file_params = json.loads(request.form.get('file_params', '{}'))
+        if not isinstance(file_params, dict) or not all(isinstance(p, dict) for p in file_params.values()):
+            raise ValueError("objet JSON attendu, associant un nom de fichier à ses paramètres")
+    except ValueError as e:
+        return jsonify({"error": f"file_params invalide : {e}"}), 400
+    shared = {key: request.form[key] for key in request.form if key not in ('file_params', 'wait')}
+    
+    try:
+        uploads = spool_batch_uploads()
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({"error": str(e)}), 400
+    if not uploads:
+        return jsonify({"error": "Aucun fichier audio fourni"}), 400
+    if len(uploads) > BATCH_MAX_FILES:
+        for _, input_path in uploads:
+            temp_files.schedule(input_path, 0)
+        return jsonify({"error": f"Au plus {BATCH_MAX_FILES} fichiers par lot"}), 400
+    
+    batch_id = str(uuid.uuid4())
+    entries, rejected = prepare_batch_entries(kind, uploads, shared, file_params)
+    task_store.create(
+        batch_id, status="processing", kind="batch", batch_kind=kind,
+        task_ids=[line["task_id"] for line, *_ in entries]
+    )
+    response = Response(stream_batch(batch_id, kind, entries, rejected), mimetype='application/x-ndjson')
+    response.headers["X-Batch-Id"] = batch_id
+    return response
+
+@app.route('/api/batch/<batch_id>/archive')
+def get_batch_archive(batch_id):
+    """Archive zip des fichiers marqués d'un lot d'insertion terminé (fichiers en erreur ou expirés exclus)."""
+    batch = task_store.get(batch_id)
+    if batch is None or batch.get("kind") != "batch" or batch.get("batch_kind") != "embed":
+        return jsonify({"error": "Lot non trouvé"}), 404
+    if batch["status"] != "completed":
+        return jsonify({"error": "Lot en cours", "status": batch["status"]}), 409
+    archive_path = temp_files.new_path(".zip")
+    names = set()
+    # Fichiers audio déjà compressés (ou PCM) : stockés sans recompression
+    with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_STORED) as archive:
+        for task_id in batch["task_ids"]:
+            task = task_store.get(task_id)
+            if task is None or task["status"] != "completed" or not os.path.exists(task["output_path"]):
+                continue
+            name = archive_member_name(task["filename"])
+            if name in names:
+                stem, ext = os.path.splitext(name)
+                name = f"{stem}_{task_id[:8]}{ext}"
+            names.add(name)
+            archive.write(task["output_path"], name)
+    temp_files.schedule(archive_path, JOB_RESULT_TTL)
+    return send_file(archive_path, mimetype='application/zip', as_attachment=True, download_name=f"{batch_id}.zip")
+
 @app.route('/api/task/<task_id>')
 def get_task_status(task_id):
-    if task_id in active_tasks:
-        return jsonify(active_tasks[task_id])
+    task = task_store.get(task_id)
+    if task is not None:
+        return jsonify({key: task[key] for key in ("status", "progress", "error") if key in task})
     return jsonify({"error": "Tâche non trouvée"}), 404
 
+@app.route('/api/result/<task_id>')
+def get_task_result(task_id):
+    response_format = request.args.get('response_format', 'binary')
+    if response_format not in RESPONSE_FORMATS:
+        return jsonify({"error": f"Format de réponse invalide (valeurs possibles : {', '.join(RESPONSE_FORMATS)})"}), 400
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({"error": "Tâche non trouvée"}), 404
+    if task["kind"] == "batch":
+        # Un lot n'a pas de résultat propre : il renvoie vers les tâches de ses fichiers et son archive
+        payload = {"error": "Identifiant de lot : résultats par fichier via /api/result/<task_id>", "task_ids": task["task_ids"]}
+        if task["batch_kind"] == "embed":
+            payload["archive_url"] = f"/api/batch/{task_id}/archive"
+        return jsonify(payload), 400
+    if task["status"] == "error":
+        return jsonify({"error": task.get("error", "Une erreur est survenue")}), 500
+    if task["status"] != "completed":
+        return jsonify({"error": "Tâche en cours", "status": task["status"], "progress": task["progress"]}), 409
+    if task["kind"] == "embed" and not os.path.exists(task["output_path"]):
+        return jsonify({"error": "Résultat expiré"}), 410
+    return job_result_response(task_id, task, task["result"], response_format)
+
 @app.route('/api/wavelets')
 def get_wavelets():
     wavelets = [w for w in pywt.wavelist(kind='discrete') if not w.startswith('bior') and not w.startswith('rbio')]
@@ -1343,7 +3279,11 @@ def get_wavelets():
 # Point de terminaison pour le health check
 @app.route('/health')
 def health_check():
-    return jsonify({"status": "ok"}), 200
+    return jsonify({
+        "status": "ok",
+        "temp_bytes": temp_files.held_bytes(),
+        "temp_quota_bytes": temp_files.quota_bytes
+    }), 200
 
 if __name__ == '__main__':
     # Utiliser le port défini par l'environnement ou 5000 par défaut